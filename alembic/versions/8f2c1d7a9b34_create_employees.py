@@ -0,0 +1,67 @@
+"""create employees and employee_tombstones
+
+Revision ID: 8f2c1d7a9b34
+Revises: 334fa8bf41de
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8f2c1d7a9b34"
+down_revision = "334fa8bf41de"
+branch_labels = None
+depends_on = None
+
+ROLES = ("developer", "lead", "qa", "manager")
+
+
+def existing_tables():
+    # databases bootstrapped by the old create_all startup hook already have these;
+    # offline SQL assumes an empty database
+    if context.is_offline_mode():
+        return set()
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade() -> None:
+    existing = existing_tables()
+
+    if "employees" not in existing:
+        op.create_table(
+            "employees",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("name", sa.String(length=100), nullable=False),
+            sa.Column("phone_number", sa.String(length=25), nullable=False),
+            sa.Column("age", sa.Integer(), nullable=False),
+            sa.Column("salary", sa.Integer(), nullable=False),
+            sa.Column("role", sa.Enum(*ROLES, name="role"), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_employees_id", "employees", ["id"])
+        op.create_index("ix_employees_name", "employees", ["name"])
+        op.create_index(
+            "ix_employees_phone_number", "employees", ["phone_number"], unique=True
+        )
+        op.create_index("ix_employees_age", "employees", ["age"])
+        op.create_index("ix_employees_salary", "employees", ["salary"])
+        op.create_index("ix_employees_updated_at", "employees", ["updated_at"])
+
+    if "employee_tombstones" not in existing:
+        op.create_table(
+            "employee_tombstones",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("employee_id", sa.Integer(), nullable=False),
+            sa.Column("deleted_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("employee_tombstones")
+    op.drop_table("employees")
+    sa.Enum(name="role").drop(op.get_bind(), checkfirst=True)
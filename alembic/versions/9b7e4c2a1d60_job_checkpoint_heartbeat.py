@@ -0,0 +1,37 @@
+"""job checkpoint and heartbeat
+
+Revision ID: 9b7e4c2a1d60
+Revises: 5d0a3e9c7f12
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9b7e4c2a1d60"
+down_revision = "5d0a3e9c7f12"
+branch_labels = None
+depends_on = None
+
+
+def existing_columns():
+    # DB_CREATE_ALL databases may already have them; offline SQL assumes not
+    if context.is_offline_mode():
+        return set()
+    return {column["name"] for column in sa.inspect(op.get_bind()).get_columns("jobs")}
+
+
+def upgrade() -> None:
+    columns = existing_columns()
+    if "checkpoint" not in columns:
+        op.add_column("jobs", sa.Column("checkpoint", sa.JSON(), nullable=True))
+    if "heartbeat_at" not in columns:
+        op.add_column("jobs", sa.Column("heartbeat_at", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("jobs") as batch_op:
+        batch_op.drop_column("heartbeat_at")
+        batch_op.drop_column("checkpoint")
@@ -0,0 +1,78 @@
+"""employee performance indexes
+
+Revision ID: c41e6b0f2d85
+Revises: 8f2c1d7a9b34
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c41e6b0f2d85"
+down_revision = "8f2c1d7a9b34"
+branch_labels = None
+depends_on = None
+
+
+def is_postgresql():
+    return op.get_bind().dialect.name == "postgresql"
+
+
+def existing_indexes():
+    # unknown when rendering SQL offline; assume the previous revision's schema
+    if context.is_offline_mode():
+        return None
+    return {
+        index["name"] for index in sa.inspect(op.get_bind()).get_indexes("employees")
+    }
+
+
+def create_index(name, columns, **kw):
+    # create_all-bootstrapped databases may already have some of these
+    existing = existing_indexes()
+    if existing is not None and name in existing:
+        return
+    if is_postgresql():
+        # CONCURRENTLY takes no write lock but cannot run inside a transaction
+        with op.get_context().autocommit_block():
+            op.create_index(
+                name, "employees", columns, postgresql_concurrently=True, **kw
+            )
+    else:
+        op.create_index(name, "employees", columns, **kw)
+
+
+def drop_index(name):
+    existing = existing_indexes()
+    if existing is not None and name not in existing:
+        return
+    if is_postgresql():
+        with op.get_context().autocommit_block():
+            op.drop_index(name, "employees", postgresql_concurrently=True)
+    else:
+        op.drop_index(name, "employees")
+
+
+def upgrade() -> None:
+    create_index("ix_employees_role_salary", ["role", "salary"])
+    create_index("ix_employees_updated_at_id", ["updated_at", "id"])
+    # the leading column of ix_employees_updated_at_id serves these lookups
+    drop_index("ix_employees_updated_at")
+    if is_postgresql():
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        create_index(
+            "ix_employees_name_trgm",
+            ["name"],
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        )
+
+
+def downgrade() -> None:
+    if is_postgresql():
+        drop_index("ix_employees_name_trgm")
+    create_index("ix_employees_updated_at", ["updated_at"])
+    drop_index("ix_employees_updated_at_id")
+    drop_index("ix_employees_role_salary")
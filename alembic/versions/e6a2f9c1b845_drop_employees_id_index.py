@@ -0,0 +1,41 @@
+"""drop the employees id index
+
+Revision ID: e6a2f9c1b845
+Revises: 9b7e4c2a1d60
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e6a2f9c1b845"
+down_revision = "9b7e4c2a1d60"
+branch_labels = None
+depends_on = None
+
+
+def existing_indexes():
+    # unknown when rendering SQL offline; assume the previous revision's schema
+    if context.is_offline_mode():
+        return None
+    return {
+        index["name"] for index in sa.inspect(op.get_bind()).get_indexes("employees")
+    }
+
+
+def upgrade() -> None:
+    # the primary key index already serves every id lookup
+    existing = existing_indexes()
+    if existing is not None and "ix_employees_id" not in existing:
+        return
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.drop_index("ix_employees_id", "employees", postgresql_concurrently=True)
+    else:
+        op.drop_index("ix_employees_id", "employees")
+
+
+def downgrade() -> None:
+    op.create_index("ix_employees_id", "employees", ["id"])
@@ -1,70 +1,249 @@
-from typing import List
+from typing import List, Optional
 import fastapi
-from fastapi import Depends, HTTPException
+from fastapi import Body, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from db.config import get_db
-from schemas.employee import EmployeeCreate, Employee, EmployeeUpdate
+from db.config import get_db, get_read_db, get_snapshot_db
+from schemas.employee import (
+    EmployeeCreate,
+    Employee,
+    EmployeeProjection,
+    EmployeeUpdate,
+    EmployeeBulkResult,
+    ExportFormat,
+    EmployeeFilter,
+    EmployeeStats,
+    StatsGroup,
+    EmployeeSelection,
+    EmployeeBulkUpdate,
+    EmployeeBulkWriteResult,
+    EmployeeChanges,
+    EmployeeBatchGet,
+    EmployeeBatch,
+    EmployeeImportResult,
+)
 from api.utils.employees import (
-    get_employee,
-    get_employee_by_phone_number,
+    get_cached_employee,
     get_employees,
+    batch_get_employees,
+    parse_fields,
+    project_employees,
     create_employee,
     put_update_employee,
     patch_update_employee,
     delete_employee,
+    bulk_upsert_employees,
+    export_ndjson,
+    export_csv,
+    bulk_delete_employees,
+    bulk_patch_employees,
+    BULK_MAX_ITEMS,
+)
+from api.utils.changes import poll_changes, stream_changes
+from api.utils.imports import import_employees, iter_lines
+from api.utils.conditional import (
+    employee_etag,
+    collection_etag,
+    collection_last_modified,
+    is_not_modified,
+    validator_headers,
 )
+from api.utils.pagination import encode_cursor
+from api.utils.stats import get_employee_stats
 
 router = fastapi.APIRouter()
 
 
-@router.get("/employees", response_model=List[Employee])
+@router.get(
+    "/employees",
+    response_model=List[EmployeeProjection],
+    response_class=ORJSONResponse,
+    response_description="Employees; with fields= only the requested keys",
+)
 async def read_employees(
-    db: AsyncSession = Depends(get_db), skip: int = 0, limit: int = 100
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    filters: EmployeeFilter = Depends(),
+    fields: Optional[str] = Query(
+        None, description="Comma-separated columns to return, e.g. id,name"
+    ),
+):
+    selected = parse_fields(fields)
+    employees = await get_employees(
+        db=db,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        sort=sort,
+        filters=filters,
+        fields=selected,
+    )
+    # validators come from the page itself, so no extra query over the whole table
+    etag = collection_etag(request.query_params.multi_items(), employees)
+    last_modified = collection_last_modified(employees)
+    headers = validator_headers(etag, last_modified)
+    if is_not_modified(request.headers, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    # rows come straight from the table, so skip response_model re-validation
+    response = ORJSONResponse(project_employees(employees, selected), headers=headers)
+    if employees and len(employees) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(sort, employees[-1])
+    return response
+
+
+@router.get("/employees/export")
+async def export_employees(
+    format: ExportFormat = ExportFormat.ndjson,
+    db: AsyncSession = Depends(get_snapshot_db),
+):
+    if format == ExportFormat.csv:
+        content, media_type = export_csv(db=db), "text/csv"
+    else:
+        content, media_type = export_ndjson(db=db), "application/x-ndjson"
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="employees.{format.value}"'
+        },
+    )
+
+
+@router.get("/employees/stats", response_model=List[EmployeeStats])
+async def read_employee_stats(
+    group_by: StatsGroup = StatsGroup.role,
+    band_width: int = Query(10, gt=0),
+    db: AsyncSession = Depends(get_read_db),
 ):
-    employees = await get_employees(db=db, skip=skip, limit=limit)
-    return employees
+    stats = await get_employee_stats(db=db, group_by=group_by, band_width=band_width)
+    return stats
+
+
+@router.get("/employees/changes", response_model=EmployeeChanges)
+async def read_employee_changes(
+    since: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    wait: float = Query(0, ge=0, le=60),
+    stream: bool = False,
+    last_event_id: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db),
+):
+    token = since or last_event_id
+    if stream:
+        return StreamingResponse(
+            stream_changes(db=db, token=token, limit=limit, duration=wait or 30),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+    changes = await poll_changes(db=db, token=token, limit=limit, wait=wait)
+    return changes
 
 
 @router.post("/employees", response_model=Employee, status_code=201)
 async def create_new_employee(
     employee: EmployeeCreate, db: AsyncSession = Depends(get_db)
 ):
-    db_employee = await get_employee_by_phone_number(
-        db=db, phone_number=employee.phone_number
-    )
-    if db_employee:
-        raise HTTPException(
-            status_code=403, detail="Phone number is already registered"
-        )
     result = await create_employee(db=db, employee=employee)
     return result
 
 
+@router.post("/employees/batch-get", response_model=EmployeeBatch)
+async def read_employee_batch(
+    batch: EmployeeBatchGet, db: AsyncSession = Depends(get_read_db)
+):
+    result = await batch_get_employees(db=db, batch=batch)
+    return result
+
+
+@router.post("/employees/import", response_model=EmployeeImportResult)
+async def import_employee_file(
+    request: Request,
+    format: ExportFormat = ExportFormat.ndjson,
+    db: AsyncSession = Depends(get_db),
+):
+    # the body is streamed and loaded chunk by chunk, never held in memory
+    result = await import_employees(
+        db=db, lines=iter_lines(request.stream()), format=format
+    )
+    return result
+
+
+@router.post("/employees/bulk", response_model=List[EmployeeBulkResult])
+async def bulk_create_employees(
+    employees: List[EmployeeCreate] = Body(..., max_items=BULK_MAX_ITEMS),
+    update_existing: bool = True,
+    db: AsyncSession = Depends(get_db),
+):
+    results = await bulk_upsert_employees(
+        db=db, employees=employees, update_existing=update_existing
+    )
+    return results
+
+
+@router.patch("/employees", response_model=EmployeeBulkWriteResult)
+async def bulk_partial_update_employees(
+    selection: EmployeeBulkUpdate, db: AsyncSession = Depends(get_db)
+):
+    result = await bulk_patch_employees(db=db, selection=selection)
+    return result
+
+
+@router.delete("/employees", response_model=EmployeeBulkWriteResult)
+async def bulk_remove_employees(
+    selection: EmployeeSelection, db: AsyncSession = Depends(get_db)
+):
+    result = await bulk_delete_employees(db=db, selection=selection)
+    return result
+
+
 @router.put("/employees/{employee_id}", response_model=Employee, status_code=200)
 async def full_update_employee(
-    employee_id: int, employee: EmployeeCreate, db: AsyncSession = Depends(get_db)
+    employee_id: int,
+    employee: EmployeeCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
 ):
     db_employee = await put_update_employee(
-        db=db, employee_id=employee_id, employee=employee
+        db=db, employee_id=employee_id, employee=employee, if_match=if_match
     )
+    response.headers["ETag"] = employee_etag(db_employee)
     return db_employee
 
 
 @router.patch("/employees/{employee_id}", response_model=Employee, status_code=200)
 async def partial_update_employee(
-    employee_id: int, employee: EmployeeUpdate, db: AsyncSession = Depends(get_db)
+    employee_id: int,
+    employee: EmployeeUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
 ):
     db_employee = await patch_update_employee(
-        db=db, employee_id=employee_id, employee=employee
+        db=db, employee_id=employee_id, employee=employee, if_match=if_match
     )
+    response.headers["ETag"] = employee_etag(db_employee)
     return db_employee
 
 
 @router.get("/employees/{employee_id}", response_model=Employee)
-async def read_employee(employee_id: int, db: AsyncSession = Depends(get_db)):
-    db_employee = await get_employee(db=db, employee_id=employee_id)
+async def read_employee(
+    employee_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+):
+    db_employee = await get_cached_employee(db=db, employee_id=employee_id)
     if db_employee is None:
         raise HTTPException(status_code=404, detail="Employee not found")
+    headers = validator_headers(employee_etag(db_employee), db_employee.updated_at)
+    if is_not_modified(request.headers, headers["ETag"], db_employee.updated_at):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     return db_employee
 
 
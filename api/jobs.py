@@ -0,0 +1,67 @@
+from typing import List
+import fastapi
+from fastapi import Body, Depends, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.config import get_db, get_read_db
+from schemas.employee import EmployeeCreate, EmployeeSelection, EmployeeBulkUpdate
+from schemas.job import Job, JobResult, SalaryAdjustment
+from api.utils.jobs import get_job, get_job_result, submit_job, JOB_MAX_ITEMS
+
+router = fastapi.APIRouter()
+
+
+async def accept_job(db: AsyncSession, response: Response, kind: str, params):
+    job = await submit_job(db=db, kind=kind, params=jsonable_encoder(params))
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return job
+
+
+@router.post("/jobs/salary-adjustments", response_model=Job, status_code=202)
+async def submit_salary_adjustment(
+    adjustment: SalaryAdjustment, response: Response, db: AsyncSession = Depends(get_db)
+):
+    job = await accept_job(db, response, "salary_adjustment", adjustment)
+    return job
+
+
+@router.post("/jobs/employees/bulk", response_model=Job, status_code=202)
+async def submit_bulk_upsert(
+    response: Response,
+    employees: List[EmployeeCreate] = Body(..., max_items=JOB_MAX_ITEMS),
+    update_existing: bool = True,
+    db: AsyncSession = Depends(get_db),
+):
+    params = {"employees": employees, "update_existing": update_existing}
+    job = await accept_job(db, response, "bulk_upsert", params)
+    return job
+
+
+@router.post("/jobs/employees/bulk-patch", response_model=Job, status_code=202)
+async def submit_bulk_patch(
+    selection: EmployeeBulkUpdate,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+):
+    job = await accept_job(db, response, "bulk_patch", selection)
+    return job
+
+
+@router.post("/jobs/employees/bulk-delete", response_model=Job, status_code=202)
+async def submit_bulk_delete(
+    selection: EmployeeSelection, response: Response, db: AsyncSession = Depends(get_db)
+):
+    job = await accept_job(db, response, "bulk_delete", selection)
+    return job
+
+
+@router.get("/jobs/{job_id}", response_model=Job)
+async def read_job(job_id: int, db: AsyncSession = Depends(get_read_db)):
+    job = await get_job(db=db, job_id=job_id)
+    return job
+
+
+@router.get("/jobs/{job_id}/result", response_model=JobResult)
+async def read_job_result(job_id: int, db: AsyncSession = Depends(get_read_db)):
+    result = await get_job_result(db=db, job_id=job_id)
+    return result
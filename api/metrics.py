@@ -0,0 +1,124 @@
+import os
+import fastapi
+from fastapi.responses import PlainTextResponse
+from db.config import engine, replica_engines, pool_stats
+from api.utils.cache import cache
+from api.utils.employees import employee_flight, page_flight
+from api.utils.admission import admission_control
+from api.utils.compression import compression_stats
+from api.utils.jobs import job_runner
+from api.utils.instrumentation import registry, process_stats, resident_memory_bytes
+
+router = fastapi.APIRouter()
+
+
+def collect_pool_checked_out():
+    engines = [("primary", engine)]
+    engines += [
+        (f"replica{index}", replica) for index, replica in enumerate(replica_engines)
+    ]
+    for name, db_engine in engines:
+        stats = pool_stats(db_engine)
+        if "checkedout" in stats:
+            yield (("engine", name),), stats["checkedout"]
+
+
+def collect_cache_lookups():
+    yield (("backend", cache.backend), ("result", "hit")), cache.hits
+    yield (("backend", cache.backend), ("result", "miss")), cache.misses
+
+
+def collect_single_flight():
+    for flight in (employee_flight, page_flight):
+        yield (("flight", flight.name), ("result", "executed")), flight.executed
+        yield (("flight", flight.name), ("result", "shared")), flight.shared
+
+
+def collect_process_memory():
+    yield (("pid", os.getpid()),), resident_memory_bytes()
+
+
+def collect_process_startup():
+    if process_stats.startup_seconds is not None:
+        yield (("pid", os.getpid()),), process_stats.startup_seconds
+
+
+def collect_jobs_running():
+    yield (), job_runner.running
+
+
+def collect_jobs_finished():
+    for status, count in sorted(job_runner.finished.items()):
+        yield (("status", status),), count
+
+
+def collect_admission_rejections():
+    for (reason, method, route), count in sorted(admission_control.rejections.items()):
+        yield (("reason", reason), ("method", method), ("route", route)), count
+
+
+def collect_admission_in_flight():
+    yield (), admission_control.concurrency.in_flight
+
+
+def collect_rate_limiter_errors():
+    limiter = admission_control.rate_limiter
+    yield (("backend", limiter.backend),), limiter.errors
+
+
+def collect_compression_bytes():
+    for encoding in sorted(compression_stats.responses):
+        labels = (("encoding", encoding),)
+        yield labels + (("direction", "in"),), compression_stats.bytes_in[encoding]
+        yield labels + (("direction", "out"),), compression_stats.bytes_out[encoding]
+
+
+registry.register("db_pool_checked_out", "gauge", collect_pool_checked_out)
+registry.register("cache_lookups_total", "counter", collect_cache_lookups)
+registry.register("single_flight_calls_total", "counter", collect_single_flight)
+registry.register("process_resident_memory_bytes", "gauge", collect_process_memory)
+registry.register("process_startup_duration_seconds", "gauge", collect_process_startup)
+registry.register("jobs_running", "gauge", collect_jobs_running)
+registry.register("jobs_finished_total", "counter", collect_jobs_finished)
+registry.register("admission_rejections_total", "counter", collect_admission_rejections)
+registry.register("admission_in_flight", "gauge", collect_admission_in_flight)
+registry.register("rate_limiter_errors_total", "counter", collect_rate_limiter_errors)
+registry.register("compression_bytes_total", "counter", collect_compression_bytes)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/metrics/slow-queries")
+async def read_slow_queries():
+    return list(registry.slow_queries)
+
+
+@router.get("/metrics/profiles")
+async def read_profiles():
+    return list(registry.profiles)
+
+
+@router.get("/metrics/pool")
+async def read_pool_metrics():
+    return {
+        "primary": pool_stats(engine),
+        "replicas": [pool_stats(replica) for replica in replica_engines],
+    }
+
+
+@router.get("/metrics/process")
+async def read_process_metrics():
+    return process_stats.stats()
+
+
+@router.get("/metrics/cache")
+async def read_cache_metrics():
+    return dict(
+        cache.stats(),
+        single_flight={
+            flight.name: flight.stats() for flight in (employee_flight, page_flight)
+        },
+    )
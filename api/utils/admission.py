@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import Counter, OrderedDict, deque, namedtuple
+from typing import Optional
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+from db.config import env_int
+
+logger = logging.getLogger("api.admission")
+
+RateLimit = namedtuple("RateLimit", ["rate", "burst"])
+
+# KEYS[1] bucket; ARGV rate, burst. Server time keeps workers consistent.
+TOKEN_BUCKET_SCRIPT = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 't', 'u')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local retry = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 'u', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(retry)
+"""
+
+
+def parse_rate_limit(value: str) -> Optional[RateLimit]:
+    # "rate[:burst]" in requests per second, e.g. "10:20"
+    if not value:
+        return None
+    rate, _, burst = value.partition(":")
+    return RateLimit(float(rate), float(burst or rate))
+
+
+def parse_route_rate_limits(value: str):
+    # "POST /employees/bulk=1:5,GET /employees/export=0.2:1"
+    limits = {}
+    for entry in filter(None, (entry.strip() for entry in value.split(","))):
+        route, _, limit = entry.rpartition("=")
+        method, _, path = route.partition(" ")
+        limits[(method.upper(), path)] = parse_rate_limit(limit)
+    return limits
+
+
+class MemoryRateLimiter:
+    backend = "memory"
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self.errors = 0
+        self._buckets = OrderedDict()
+
+    async def acquire(self, key: str, limit: RateLimit) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (limit.burst, now))
+        tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / limit.rate
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+class RedisRateLimiter:
+    backend = "redis"
+
+    def __init__(self, client, prefix: str = "fastapi-crud:rate:"):
+        self.client = client
+        self.prefix = prefix
+        self.errors = 0
+
+    @classmethod
+    def from_url(cls, url: str):
+        import redis.asyncio
+
+        return cls(redis.asyncio.from_url(url))
+
+    async def acquire(self, key: str, limit: RateLimit) -> float:
+        try:
+            retry_after = await self.client.eval(
+                TOKEN_BUCKET_SCRIPT, 1, self.prefix + key, limit.rate, limit.burst
+            )
+        except Exception:
+            # an unreachable limiter must not take the API down with it
+            self.errors += 1
+            logger.warning("rate limiter unavailable, admitting request")
+            return 0.0
+        return float(retry_after)
+
+
+def create_rate_limiter(url: Optional[str] = None):
+    if url and url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisRateLimiter.from_url(url)
+    return MemoryRateLimiter()
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int, max_wait: float):
+        self.limit = limit
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._waiters = deque()
+
+    async def acquire(self) -> bool:
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        if self.max_wait <= 0:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # release() hands its slot straight to the waiter
+            await asyncio.wait_for(waiter, self.max_wait)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+class AdmissionControl:
+    def __init__(self, rate_limiter, default_limit, route_limits, concurrency):
+        self.rate_limiter = rate_limiter
+        self.default_limit = default_limit
+        self.route_limits = route_limits
+        self.concurrency = concurrency
+        self.key_header = os.getenv("RATE_LIMIT_KEY_HEADER", "").lower().encode()
+        self.exempt_paths = tuple(
+            path
+            for path in os.getenv(
+                "ADMISSION_EXEMPT_PATHS", "/metrics,/employees/changes"
+            ).split(",")
+            if path
+        )
+        self.rejections = Counter()
+
+    def client_key(self, scope):
+        if self.key_header:
+            for name, value in scope["headers"]:
+                if name == self.key_header:
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    def rate_limit(self, method: str, route: str) -> Optional[RateLimit]:
+        return self.route_limits.get((method, route), self.default_limit)
+
+    def reject(self, reason: str, method: str, route: str):
+        self.rejections[(reason, method, route)] += 1
+
+
+def create_admission_control():
+    # one DB connection per admitted request; sized to this worker's pool
+    pool_capacity = env_int("DB_POOL_SIZE", 5) + env_int("DB_MAX_OVERFLOW", 10)
+    return AdmissionControl(
+        rate_limiter=create_rate_limiter(os.getenv("RATE_LIMIT_URL")),
+        default_limit=parse_rate_limit(os.getenv("RATE_LIMIT", "")),
+        route_limits=parse_route_rate_limits(os.getenv("RATE_LIMIT_ROUTES", "")),
+        concurrency=ConcurrencyLimiter(
+            limit=env_int("ADMISSION_MAX_CONCURRENCY", pool_capacity),
+            max_wait=float(os.getenv("ADMISSION_MAX_WAIT", 0.1)),
+        ),
+    )
+
+
+admission_control = create_admission_control()
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    def match_route(self, scope):
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route
+        return None
+
+    async def __call__(self, scope, receive, send):
+        control = admission_control
+        if scope["type"] != "http" or scope["path"].startswith(control.exempt_paths):
+            await self.app(scope, receive, send)
+            return
+
+        route = self.match_route(scope)
+        if route is not None:
+            scope["route"] = route
+        method = scope["method"]
+        path = route.path if route is not None else "<unmatched>"
+
+        limit = control.rate_limit(method, path)
+        if limit is not None:
+            key = f"{control.client_key(scope)}:{method}:{path}"
+            retry_after = await control.rate_limiter.acquire(key, limit)
+            if retry_after > 0:
+                control.reject("rate_limit", method, path)
+                response = JSONResponse(
+                    {"detail": "Too many requests"},
+                    status_code=429,
+                    headers={"Retry-After": str(math.ceil(retry_after))},
+                )
+                await response(scope, receive, send)
+                return
+
+        if not await control.concurrency.acquire():
+            control.reject("concurrency", method, path)
+            response = JSONResponse(
+                {"detail": "Server is busy, try again later"},
+                status_code=503,
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            control.concurrency.release()
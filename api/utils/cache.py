@@ -0,0 +1,175 @@
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# KEYS: value and version key pairs; ARGV[1] ttl, then value and version pairs.
+# An empty value only records the version, see Cache.set_versioned.
+SET_VERSIONED_SCRIPT = """
+local ttl = ARGV[1]
+for i = 1, #KEYS, 2 do
+    local value, version = ARGV[i + 1], tonumber(ARGV[i + 2])
+    local current = tonumber(redis.call('GET', KEYS[i + 1]))
+    if not current or current <= version then
+        if value == '' then
+            redis.call('DEL', KEYS[i])
+        else
+            redis.call('SET', KEYS[i], value, 'EX', ttl)
+        end
+        redis.call('SET', KEYS[i + 1], version, 'EX', ttl)
+    end
+end
+return 0
+"""
+
+
+class Cache(ABC):
+    backend = "none"
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, value):
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str):
+        ...
+
+    @abstractmethod
+    async def delete(self, *keys: str):
+        ...
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        return [await self.get(key) for key in keys]
+
+    async def set_many(self, items: Dict[str, str]):
+        for key, value in items.items():
+            await self.set(key, value)
+
+    @abstractmethod
+    async def set_versioned(self, items: Dict[str, Tuple[Optional[str], int]]):
+        # a value read before a newer write must not replace it; a None value
+        # drops the entry but keeps its version so older reads stay out
+        ...
+
+    def stats(self):
+        return {"backend": self.backend, "hits": self.hits, "misses": self.misses}
+
+
+class LRUCache(Cache):
+    backend = "memory"
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60):
+        super().__init__(ttl=ttl)
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at, _ = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                return self.record(value)
+            del self._entries[key]
+        return self.record(None)
+
+    async def set(self, key: str, value: str, version: Optional[int] = None):
+        self._entries[key] = (value, time.monotonic() + self.ttl, version)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def set_versioned(self, items: Dict[str, Tuple[Optional[str], int]]):
+        now = time.monotonic()
+        for key, (value, version) in items.items():
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now and entry[2] is not None:
+                if entry[2] > version:
+                    continue
+            await self.set(key, value, version)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return dict(super().stats(), size=len(self._entries))
+
+
+class RedisCache(Cache):
+    backend = "redis"
+
+    def __init__(self, client, ttl: float = 60, prefix: str = "fastapi-crud:"):
+        super().__init__(ttl=ttl)
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, ttl: float = 60):
+        import redis.asyncio
+
+        return cls(redis.asyncio.from_url(url), ttl=ttl)
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await self.client.get(self.prefix + key)
+        if isinstance(value, bytes):
+            value = value.decode()
+        return self.record(value)
+
+    async def set(self, key: str, value: str):
+        await self.client.set(self.prefix + key, value, ex=max(int(self.ttl), 1))
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        values = await self.client.mget([self.prefix + key for key in keys])
+        return [
+            self.record(value.decode() if isinstance(value, bytes) else value)
+            for value in values
+        ]
+
+    async def set_many(self, items: Dict[str, str]):
+        # one round trip for the whole batch
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(self.prefix + key, value, ex=max(int(self.ttl), 1))
+            await pipe.execute()
+
+    async def set_versioned(self, items: Dict[str, Tuple[Optional[str], int]]):
+        if not items:
+            return
+        keys, args = [], [max(int(self.ttl), 1)]
+        for key, (value, version) in items.items():
+            keys += [self.prefix + key, self.prefix + "version:" + key]
+            args += [value or "", version]
+        await self.client.eval(SET_VERSIONED_SCRIPT, len(keys), *keys, *args)
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self.client.delete(*(self.prefix + key for key in keys))
+
+
+def create_cache(url: Optional[str] = None) -> Cache:
+    ttl = float(os.getenv("CACHE_TTL", 60))
+    if url and url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache.from_url(url, ttl=ttl)
+    return LRUCache(maxsize=int(os.getenv("CACHE_MAXSIZE", 10000)), ttl=ttl)
+
+
+cache = create_cache(os.getenv("CACHE_URL"))
@@ -0,0 +1,153 @@
+import asyncio
+import base64
+import binascii
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from db.models.employee import Employee, EmployeeTombstone
+from schemas.employee import Employee as EmployeeSchema
+from schemas.employee import EmployeeChange, EmployeeChanges
+
+# other workers' writes are only noticed by re-polling at this interval
+CHANGES_POLL_INTERVAL = 1.0
+CHANGES_KEEPALIVE = 15.0
+# updated_at is taken before commit, so a write stamped earlier than one
+# already visible may still be committing; the feed stays this far behind
+CHANGES_SAFETY_LAG = float(os.getenv("CHANGES_SAFETY_LAG", 2))
+
+waiters = set()
+
+
+def notify_changes():
+    for waiter in waiters:
+        if not waiter.done():
+            waiter.set_result(None)
+
+
+async def wait_for_changes(timeout: float):
+    waiter = asyncio.get_running_loop().create_future()
+    waiters.add(waiter)
+    try:
+        await asyncio.wait_for(waiter, timeout=min(timeout, CHANGES_POLL_INTERVAL))
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        waiters.discard(waiter)
+
+
+def encode_change_token(updated_at: Optional[datetime], employee_id: int, tombstone_id):
+    payload = {
+        "u": updated_at.isoformat() if updated_at is not None else None,
+        "i": employee_id,
+        "t": tombstone_id,
+    }
+    token = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(token).decode()
+
+
+def decode_change_token(token: Optional[str]):
+    if not token:
+        return None, 0, 0
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+        updated_at = payload["u"] and datetime.fromisoformat(payload["u"])
+        return updated_at, int(payload["i"]), int(payload["t"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid change token")
+
+
+async def get_changes(db: AsyncSession, token: Optional[str], limit: int = 100):
+    updated_at, employee_id, tombstone_id = decode_change_token(token)
+    horizon = datetime.utcnow() - timedelta(seconds=CHANGES_SAFETY_LAG)
+
+    query = (
+        select(*Employee.__table__.c)
+        .where(Employee.updated_at <= horizon)
+        .order_by(Employee.updated_at, Employee.id)
+    )
+    if updated_at is not None:
+        query = query.where(
+            or_(
+                Employee.updated_at > updated_at,
+                and_(Employee.updated_at == updated_at, Employee.id > employee_id),
+            )
+        )
+    employees = (await db.execute(query.limit(limit))).all()
+
+    query = (
+        select(EmployeeTombstone)
+        .where(
+            EmployeeTombstone.id > tombstone_id,
+            EmployeeTombstone.deleted_at <= horizon,
+        )
+        .order_by(EmployeeTombstone.id)
+        .limit(limit)
+    )
+    tombstones = (await db.execute(query)).scalars().all()
+
+    changes = []
+    for row in employees:
+        created = updated_at is None or row.created_at > updated_at
+        changes.append(
+            EmployeeChange(
+                type="created" if created else "updated",
+                id=row.id,
+                employee=EmployeeSchema.from_orm(row),
+            )
+        )
+    for tombstone in tombstones:
+        changes.append(
+            EmployeeChange(
+                type="deleted",
+                id=tombstone.employee_id,
+                deleted_at=tombstone.deleted_at,
+            )
+        )
+
+    if employees:
+        updated_at, employee_id = employees[-1].updated_at, employees[-1].id
+    if tombstones:
+        tombstone_id = tombstones[-1].id
+    return EmployeeChanges(
+        changes=changes,
+        next_token=encode_change_token(updated_at, employee_id, tombstone_id),
+        has_more=len(employees) == limit or len(tombstones) == limit,
+    )
+
+
+async def poll_changes(
+    db: AsyncSession, token: Optional[str], limit: int = 100, wait: float = 0
+):
+    deadline = time.monotonic() + wait
+    while True:
+        changes = await get_changes(db=db, token=token, limit=limit)
+        # release the connection while waiting
+        await db.commit()
+        remaining = deadline - time.monotonic()
+        if changes.changes or remaining <= 0:
+            return changes
+        await wait_for_changes(remaining)
+
+
+async def stream_changes(
+    db: AsyncSession, token: Optional[str], limit: int = 100, duration: float = 30
+):
+    deadline = time.monotonic() + duration
+    yield "retry: 1000\n\n"
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        wait = min(remaining, CHANGES_KEEPALIVE)
+        changes = await poll_changes(db=db, token=token, limit=limit, wait=wait)
+        token = changes.next_token
+        if changes.changes:
+            yield f"id: {token}\nevent: changes\ndata: {changes.json()}\n\n"
+        else:
+            yield ": keepalive\n\n"
@@ -0,0 +1,161 @@
+import os
+import zlib
+from collections import Counter
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", 3))
+# SSE must reach the client event by event, so it is never buffered here
+UNCOMPRESSED_TYPES = ("text/event-stream", "image/", "video/", "audio/")
+
+
+class BrotliCompressor:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.finish()
+
+
+def gzip_compressor():
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+
+def zstd_compressor():
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+
+# server preference when the client accepts several with the same q
+ENCODERS = {"gzip": gzip_compressor}
+if brotli is not None:
+    ENCODERS = {"br": BrotliCompressor, **ENCODERS}
+if zstandard is not None:
+    ENCODERS = {"zstd": zstd_compressor, **ENCODERS}
+
+
+def negotiate_encoding(accept_encoding: str, encoders=ENCODERS):
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            weights[coding.lower()] = quality
+    best, best_quality = None, 0.0
+    for coding in encoders:
+        quality = weights.get(coding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class CompressionStats:
+    def __init__(self):
+        self.bytes_in = Counter()
+        self.bytes_out = Counter()
+        self.responses = Counter()
+
+
+compression_stats = CompressionStats()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = (
+                message["status"] < 200
+                or message["status"] in (204, 304)
+                or "content-encoding" in headers
+                or content_type.startswith(UNCOMPRESSED_TYPES)
+            )
+            if self.passthrough:
+                await self._send(message)
+            else:
+                # wait for the first body chunk to decide
+                self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is None:
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self._send(self.start)
+                await self._send(message)
+                return
+            self.compressor = ENCODERS[self.encoding]()
+            headers = MutableHeaders(scope=self.start)
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                compressed = self.compress(body, final=True)
+                headers["Content-Length"] = str(len(compressed))
+                await self._send(self.start)
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+            await self._send(self.start)
+        compressed = self.compress(body, final=not more_body)
+        await self._send(
+            {"type": "http.response.body", "body": compressed, "more_body": more_body}
+        )
+
+    def compress(self, body: bytes, final: bool) -> bytes:
+        compressed = self.compressor.compress(body)
+        if final:
+            compressed += self.compressor.flush()
+            compression_stats.responses[self.encoding] += 1
+        compression_stats.bytes_in[self.encoding] += len(body)
+        compression_stats.bytes_out[self.encoding] += len(compressed)
+        return compressed
@@ -0,0 +1,73 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import List, Optional
+from fastapi import HTTPException
+
+ETAG_TIME_FORMAT = "%Y%m%d%H%M%S%f"
+
+
+def employee_etag(employee) -> str:
+    return f'"{employee.id}-{employee.updated_at.strftime(ETAG_TIME_FORMAT)}"'
+
+
+def collection_etag(params, rows: List[dict]) -> str:
+    # built from the page itself: any write that changes the page changes the tag
+    versions = ",".join(
+        f"{row['id']}-{row['updated_at'].strftime(ETAG_TIME_FORMAT)}" for row in rows
+    )
+    fingerprint = f"{sorted(params)}|{versions}"
+    return f'"{hashlib.sha1(fingerprint.encode()).hexdigest()[:20]}"'
+
+
+def collection_last_modified(rows: List[dict]) -> Optional[datetime]:
+    return max((row["updated_at"] for row in rows), default=None)
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime]):
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def is_not_modified(headers, etag: str, last_modified: Optional[datetime]) -> bool:
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP dates have second precision
+        modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+        return modified <= since
+    return False
+
+
+def parse_if_match(
+    if_match: Optional[str], employee_id: int
+) -> Optional[List[datetime]]:
+    if if_match is None or if_match.strip() == "*":
+        return None
+    versions = []
+    for tag in if_match.split(","):
+        tag_id, _, version = tag.strip().strip('"').partition("-")
+        if tag_id != str(employee_id):
+            continue
+        try:
+            versions.append(datetime.strptime(version, ETAG_TIME_FORMAT))
+        except ValueError:
+            continue
+    if not versions:
+        raise HTTPException(status_code=412, detail="Employee has been modified")
+    return versions
@@ -1,9 +1,52 @@
-from datetime import datetime
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import Integer, any_, delete, insert, literal, literal_column
+from sqlalchemy import update
+from sqlalchemy.sql.expression import Update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
 from sqlalchemy.future import select
-from db.models.employee import Employee
-from schemas.employee import EmployeeCreate, EmployeeUpdate
+from db.models.employee import Employee, EmployeeTombstone
+from db.models.employee import employee_data_error, employee_errors
+from schemas.employee import (
+    EmployeeCreate,
+    EmployeeUpdate,
+    EmployeeBulkResult,
+    EmployeeFilter,
+    EmployeeSelection,
+    EmployeeBulkUpdate,
+    EmployeeBatchGet,
+)
+from schemas.employee import Employee as EmployeeSchema
+from api.utils.cache import cache
+from db.config import reads_replica, sibling_session
+from api.utils.conditional import parse_if_match
+from api.utils.filters import filter_clauses
+from api.utils.changes import notify_changes
+from api.utils.singleflight import SingleFlight
+from api.utils.stats import invalidate_employee_stats
+from api.utils.pagination import parse_sort, order_clauses, seek_clause, decode_cursor
+
+BULK_CHUNK_SIZE = 1000
+BULK_MAX_ITEMS = 10000
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FIELDS = (
+    "id",
+    "name",
+    "age",
+    "role",
+    "salary",
+    "phone_number",
+    "created_at",
+    "updated_at",
+)
+PROJECTABLE_FIELDS = EXPORT_FIELDS
+UPSERT_FIELDS = ("name", "age", "role", "salary", "updated_at")
 
 
 async def get_employee(db: AsyncSession, employee_id: int):
@@ -12,90 +55,581 @@ async def get_employee(db: AsyncSession, employee_id: int):
     return result.scalar_one_or_none()
 
 
-async def get_employee_by_phone_number(db: AsyncSession, phone_number: str):
-    query = select(Employee).where(Employee.phone_number == phone_number)
-    result = await db.execute(query)
-    return result.scalar_one_or_none()
+employee_flight = SingleFlight("employee")
+page_flight = SingleFlight("employees")
 
 
-async def get_employees(db: AsyncSession, skip: int = 0, limit: int = 100):
-    query = select(Employee).offset(skip).limit(limit)
-    result = await db.execute(query)
-    return result.scalars().all()
+def employee_version(updated_at: datetime) -> int:
+    # microseconds since the epoch, exact as a number in Redis scripts too
+    return (updated_at - datetime(1970, 1, 1)) // timedelta(microseconds=1)
 
 
-async def create_employee(db: AsyncSession, employee: EmployeeCreate):
-    db_employee = Employee(
-        name=employee.name,
-        age=employee.age,
-        phone_number=employee.phone_number,
-        role=employee.role,
-        salary=employee.salary,
+async def forget_employees(employee_ids, version: Optional[datetime] = None):
+    # rows read before the write (version) can no longer be cached over it
+    stamp = employee_version(version or datetime.utcnow())
+    await cache.set_versioned(
+        {employee_cache_key(employee_id): (None, stamp) for employee_id in employee_ids}
     )
-    db.add(db_employee)
-    await db.commit()
-    await db.refresh(db_employee)
-    return db_employee
+    employee_flight.forget(*employee_ids)
 
 
-async def put_update_employee(
-    db: AsyncSession, employee: EmployeeCreate, employee_id: int
-):
-    db_employee = await get_employee(db=db, employee_id=employee_id)
+async def employees_changed(*employee_ids: int, version: Optional[datetime] = None):
+    await forget_employees(employee_ids, version=version)
+    page_flight.clear()
+    await invalidate_employee_stats()
+    notify_changes()
+
+
+def employee_cache_key(employee_id: int):
+    return f"employee:{employee_id}"
+
+
+def phone_number_cache_key(phone_number: str):
+    return f"employee:phone:{phone_number}"
+
+
+async def cache_employee(db_employee: Employee):
+    employee = EmployeeSchema.from_orm(db_employee)
+    version = employee_version(employee.updated_at)
+    await cache.set_versioned(
+        {employee_cache_key(employee.id): (employee.json(), version)}
+    )
+    # phone entries only point at the id entry, so a stale one can never win
+    await cache.set(phone_number_cache_key(employee.phone_number), str(employee.id))
+    return employee
+
+
+async def cache_employees(db: AsyncSession, rows):
+    employees = [EmployeeSchema.from_orm(row) for row in rows]
+    if reads_replica(db):
+        # a lagging replica could put back a row that a write just replaced
+        return employees
+    await cache.set_versioned(
+        {
+            employee_cache_key(employee.id): (
+                employee.json(),
+                employee_version(employee.updated_at),
+            )
+            for employee in employees
+        }
+    )
+    await cache.set_many(
+        {
+            phone_number_cache_key(employee.phone_number): str(employee.id)
+            for employee in employees
+        }
+    )
+    return employees
+
 
+async def load_employee(db: AsyncSession, employee_id: int):
+    # shared by every caller of the flight, so it must not borrow the session
+    # of whichever request started it
+    async with sibling_session(db) as flight_db:
+        db_employee = await get_employee(db=flight_db, employee_id=employee_id)
     if db_employee is None:
-        raise HTTPException(status_code=404, detail="Employee not found!")
+        return None
+    employees = await cache_employees(db=db, rows=[db_employee])
+    return employees[0]
+
 
-    existing_employee = await get_employee_by_phone_number(
-        db=db, phone_number=employee.phone_number
+async def get_cached_employee(db: AsyncSession, employee_id: int):
+    cached = await cache.get(employee_cache_key(employee_id))
+    if cached is not None:
+        return EmployeeSchema.parse_raw(cached)
+    # concurrent misses for one id share a single SELECT
+    return await employee_flight.do(
+        employee_id, lambda: load_employee(db=db, employee_id=employee_id)
     )
-    if existing_employee:
-        if existing_employee.id != employee_id:
+
+
+async def get_employees_by_ids(db: AsyncSession, ids: List[int]):
+    keys = list(dict.fromkeys(ids))
+    cached = await cache.get_many([employee_cache_key(key) for key in keys])
+    found = {
+        key: EmployeeSchema.parse_raw(value)
+        for key, value in zip(keys, cached)
+        if value is not None
+    }
+    missing = [key for key in keys if key not in found]
+    dialect = db.get_bind().dialect.name
+    for start in range(0, len(missing), BULK_CHUNK_SIZE):
+        chunk = missing[start : start + BULK_CHUNK_SIZE]
+        query = select(*Employee.__table__.c).where(ids_clause(chunk, dialect))
+        for employee in await cache_employees(
+            db=db, rows=(await db.execute(query)).all()
+        ):
+            found[employee.id] = employee
+    return found
+
+
+async def get_employees_by_phone_numbers(db: AsyncSession, phone_numbers: List[str]):
+    keys = list(dict.fromkeys(phone_numbers))
+    pointers = await cache.get_many([phone_number_cache_key(key) for key in keys])
+    ids = {key: int(value) for key, value in zip(keys, pointers) if value is not None}
+    cached = await cache.get_many([employee_cache_key(id_) for id_ in ids.values()])
+    found = {}
+    for key, value in zip(ids, cached):
+        employee = EmployeeSchema.parse_raw(value) if value is not None else None
+        # the pointer may be stale, see cache_employee
+        if employee is not None and employee.phone_number == key:
+            found[key] = employee
+    missing = [key for key in keys if key not in found]
+    for start in range(0, len(missing), BULK_CHUNK_SIZE):
+        chunk = missing[start : start + BULK_CHUNK_SIZE]
+        query = select(*Employee.__table__.c).where(Employee.phone_number.in_(chunk))
+        for employee in await cache_employees(
+            db=db, rows=(await db.execute(query)).all()
+        ):
+            found[employee.phone_number] = employee
+    return found
+
+
+async def batch_get_employees(db: AsyncSession, batch: EmployeeBatchGet):
+    if batch.ids is not None:
+        keys = batch.ids
+        found = await get_employees_by_ids(db=db, ids=keys)
+    else:
+        keys = batch.phone_numbers
+        found = await get_employees_by_phone_numbers(db=db, phone_numbers=keys)
+    return {
+        "employees": [found[key] for key in keys if key in found],
+        "missing": [key for key in dict.fromkeys(keys) if key not in found],
+    }
+
+
+def parse_fields(fields: Optional[str]):
+    if not fields:
+        return None
+    selected = []
+    for field in fields.split(","):
+        field = field.strip()
+        if field not in PROJECTABLE_FIELDS:
             raise HTTPException(
-                status_code=403, detail="Phone number is already registered"
+                status_code=400,
+                detail=f"Invalid field! Available fields: {list(PROJECTABLE_FIELDS)}",
             )
+        if field not in selected:
+            selected.append(field)
+    return selected
 
-    for var, value in vars(employee).items():
-        setattr(db_employee, var, value) if value is not None else None
 
-    db_employee.updated_at = datetime.utcnow()
-    db.add(db_employee)
-    await db.commit()
-    await db.refresh(db_employee)
-    return db_employee
+def project_employees(employees: List[dict], fields: Optional[List[str]]):
+    if fields is None:
+        return employees
+    # rows may be shared with other requests, so build new dicts
+    return [{field: employee[field] for field in fields} for employee in employees]
 
 
-async def patch_update_employee(
-    db: AsyncSession, employee: EmployeeUpdate, employee_id: int
+async def get_employees(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    filters: Optional[EmployeeFilter] = None,
+    fields: Optional[List[str]] = None,
 ):
-    db_employee = await get_employee(db=db, employee_id=employee_id)
-    if db_employee is None:
-        raise HTTPException(status_code=404, detail="Employee not found!")
+    keys = parse_sort(sort)
+    columns = Employee.__table__.c
+    if fields is not None:
+        # sort keys stay selected for the next cursor, id and updated_at for the ETag
+        extra = [field for field, _ in keys] + ["id", "updated_at"]
+        selected = list(dict.fromkeys([*fields, *extra]))
+        columns = [Employee.__table__.c[field] for field in selected]
+    query = select(*columns).order_by(*order_clauses(keys))
+    if filters is not None:
+        dialect = db.get_bind().dialect.name
+        query = query.where(*filter_clauses(filters, dialect=dialect))
+    if cursor:
+        query = query.where(seek_clause(keys, decode_cursor(cursor, sort)))
+    else:
+        query = query.offset(skip)
+    query = query.limit(limit)
+
+    async def fetch():
+        async with sibling_session(db) as flight_db:
+            result = await flight_db.execute(query)
+            return [dict(row) for row in result.mappings()]
+
+    # identical page requests share one query; the rows are never mutated
+    key = (
+        "page",
+        skip,
+        limit,
+        cursor,
+        sort,
+        filters.json() if filters else None,
+        tuple(fields) if fields is not None else None,
+    )
+    return await page_flight.do(key, fetch)
+
+
+async def stream_employees(db: AsyncSession, chunk_size: int = EXPORT_CHUNK_SIZE):
+    columns = [Employee.__table__.c[field] for field in EXPORT_FIELDS]
+    query = (
+        select(*columns).order_by(Employee.id).execution_options(yield_per=chunk_size)
+    )
+    result = await db.stream(query)
+    async for rows in result.partitions(chunk_size):
+        yield rows
+
+
+def export_values(row):
+    values = dict(row._mapping)
+    if values["role"] is not None:
+        values["role"] = int(values["role"])
+    for field in ("created_at", "updated_at"):
+        values[field] = values[field].isoformat()
+    return values
+
+
+async def export_ndjson(db: AsyncSession):
+    async for rows in stream_employees(db=db):
+        yield "".join(json.dumps(export_values(row)) + "\n" for row in rows)
+
+
+async def export_csv(db: AsyncSession):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    async for rows in stream_employees(db=db):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(export_values(row) for row in rows)
+        yield buffer.getvalue()
+
+
+def validate_employee_data(data: dict):
+    error = employee_data_error(data)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+
+
+async def get_ids_by_phone_number(db: AsyncSession, phone_numbers: List[str]):
+    query = select(Employee.phone_number, Employee.id).where(
+        Employee.phone_number.in_(phone_numbers)
+    )
+    result = await db.execute(query)
+    return dict(result.all())
+
+
+async def upsert_employees_chunk(
+    db: AsyncSession, rows: List[dict], update_existing: bool = True
+):
+    dialect = db.get_bind().dialect.name
+    dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = dialect_insert(Employee).values(rows)
+    if update_existing:
+        statement = statement.on_conflict_do_update(
+            index_elements=[Employee.phone_number],
+            set_={field: statement.excluded[field] for field in UPSERT_FIELDS},
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(
+            index_elements=[Employee.phone_number]
+        )
+    phone_numbers = [row["phone_number"] for row in rows]
+
+    if dialect == "postgresql":
+        # xmax is 0 only for rows this statement inserted
+        result = await db.execute(
+            statement.returning(
+                Employee.id, Employee.phone_number, literal_column("xmax = 0")
+            )
+        )
+        outcome = {
+            phone_number: (employee_id, "created" if created else "updated")
+            for employee_id, phone_number, created in result
+        }
+        skipped = [number for number in phone_numbers if number not in outcome]
+        if skipped:
+            existing = await get_ids_by_phone_number(db=db, phone_numbers=skipped)
+            for phone_number, employee_id in existing.items():
+                outcome[phone_number] = (employee_id, "unchanged")
+        return outcome
+
+    # no RETURNING on this dialect: look the ids up around the upsert instead
+    existing = await get_ids_by_phone_number(db=db, phone_numbers=phone_numbers)
+    await db.execute(statement)
+    status = "updated" if update_existing else "unchanged"
+    outcome = {
+        number: (employee_id, status) for number, employee_id in existing.items()
+    }
+    new = [number for number in phone_numbers if number not in existing]
+    if new:
+        created = await get_ids_by_phone_number(db=db, phone_numbers=new)
+        for phone_number, employee_id in created.items():
+            outcome[phone_number] = (employee_id, "created")
+    return outcome
+
+
+async def bulk_upsert_employees(
+    db: AsyncSession,
+    employees: List[EmployeeCreate],
+    update_existing: bool = True,
+    chunk_size: int = BULK_CHUNK_SIZE,
+):
+    results = [None] * len(employees)
+    pending = {}
+    rows = [employee.dict() for employee in employees]
+    for index, error in enumerate(employee_errors(rows)):
+        if error:
+            results[index] = EmployeeBulkResult(
+                index=index, status="error", detail=error
+            )
+            continue
+        phone_number = rows[index]["phone_number"]
+        previous = pending.pop(phone_number, None)
+        if previous is not None:
+            results[previous] = EmployeeBulkResult(
+                index=previous,
+                status="error",
+                detail="Phone number is repeated later in the batch",
+            )
+        pending[phone_number] = index
+
+    now = datetime.utcnow()
+    indexes = list(pending.values())
+    for start in range(0, len(indexes), chunk_size):
+        chunk = indexes[start : start + chunk_size]
+        outcome = await upsert_employees_chunk(
+            db=db,
+            rows=[dict(rows[index], created_at=now, updated_at=now) for index in chunk],
+            update_existing=update_existing,
+        )
+        for index in chunk:
+            employee_id, status = outcome[rows[index]["phone_number"]]
+            results[index] = EmployeeBulkResult(
+                index=index, status=status, id=employee_id
+            )
 
-    existing_employee = await get_employee_by_phone_number(
-        db=db, phone_number=employee.phone_number
+    await db.commit()
+    await employees_changed(
+        *(result.id for result in results if result.status == "updated"),
+        version=now,
     )
-    if existing_employee:
+    return results
+
+
+async def employee_exists(db: AsyncSession, employee_id: int) -> bool:
+    query = select(Employee.id).where(Employee.id == employee_id)
+    return (await db.execute(query)).first() is not None
+
+
+async def write_employee(db: AsyncSession, statement, employee_id=None):
+    # one round trip where RETURNING is available; otherwise re-read the row
+    columns = Employee.__table__.c
+    try:
+        if db.get_bind().dialect.full_returning:
+            result = await db.execute(statement.returning(*columns))
+            row = result.one_or_none()
+        else:
+            result = await db.execute(statement)
+            if employee_id is None:
+                employee_id = result.inserted_primary_key[0]
+            row = None
+            if result.rowcount != 0:
+                query = select(*columns).where(Employee.id == employee_id)
+                row = (await db.execute(query)).one_or_none()
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
         raise HTTPException(
             status_code=403, detail="Phone number is already registered"
         )
+    if row is None:
+        if employee_id is not None and await employee_exists(db, employee_id):
+            raise HTTPException(status_code=412, detail="Employee has been modified")
+        raise HTTPException(status_code=404, detail="Employee not found!")
+    await employees_changed(row.id, version=row.updated_at)
+    return await cache_employee(row)
 
-    employee_data = employee.dict(exclude_unset=True)
-    for var, value in employee_data.items():
-        setattr(db_employee, var, value) if value is not None else None
 
-    db_employee.updated_at = datetime.utcnow()
-    db.add(db_employee)
-    await db.commit()
-    await db.refresh(db_employee)
-    return db_employee
+async def create_employee(db: AsyncSession, employee: EmployeeCreate):
+    employee_data = employee.dict()
+    validate_employee_data(employee_data)
+    now = datetime.utcnow()
+    statement = insert(Employee).values(**employee_data, created_at=now, updated_at=now)
+    return await write_employee(db=db, statement=statement)
+
+
+async def update_employee(
+    db: AsyncSession,
+    employee_data: dict,
+    employee_id: int,
+    if_match: Optional[str] = None,
+):
+    validate_employee_data(employee_data)
+    statement = (
+        update(Employee)
+        .where(Employee.id == employee_id)
+        .values(**employee_data, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    versions = parse_if_match(if_match, employee_id)
+    if versions is not None:
+        # optimistic concurrency: only update the version the client has seen
+        statement = statement.where(Employee.updated_at.in_(versions))
+    return await write_employee(db=db, statement=statement, employee_id=employee_id)
+
+
+async def put_update_employee(
+    db: AsyncSession,
+    employee: EmployeeCreate,
+    employee_id: int,
+    if_match: Optional[str] = None,
+):
+    return await update_employee(
+        db=db, employee_data=employee.dict(), employee_id=employee_id, if_match=if_match
+    )
+
+
+async def patch_update_employee(
+    db: AsyncSession,
+    employee: EmployeeUpdate,
+    employee_id: int,
+    if_match: Optional[str] = None,
+):
+    employee_data = {
+        var: value
+        for var, value in employee.dict(exclude_unset=True).items()
+        if value is not None
+    }
+    return await update_employee(
+        db=db, employee_data=employee_data, employee_id=employee_id, if_match=if_match
+    )
 
 
 async def delete_employee(db: AsyncSession, employee_id: int):
-    employee = await get_employee(db=db, employee_id=employee_id)
-    print(employee)
-    if employee is None:
+    result = await db.execute(delete(Employee).where(Employee.id == employee_id))
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Employee not found!")
-    await db.delete(employee)
+    await db.execute(insert(EmployeeTombstone).values(employee_id=employee_id))
     await db.commit()
+    await employees_changed(employee_id)
     return {"ok": True}
+
+
+def ids_clause(ids: List[int], dialect: str):
+    if dialect == "postgresql":
+        # one array parameter instead of one bind per id
+        return Employee.id == any_(literal(ids, postgresql.ARRAY(Integer)))
+    return Employee.id.in_(ids)
+
+
+async def selected_id_chunks(
+    db: AsyncSession, selection: EmployeeSelection, chunk_size: int, after_id: int = 0
+):
+    if selection.ids is not None:
+        ids = sorted(id_ for id_ in set(selection.ids) if id_ > after_id)
+        for start in range(0, len(ids), chunk_size):
+            yield ids[start : start + chunk_size]
+        return
+    clauses = filter_clauses(selection.filter, dialect=db.get_bind().dialect.name)
+    last_id = after_id
+    while True:
+        query = (
+            select(Employee.id)
+            .where(*clauses, Employee.id > last_id)
+            .order_by(Employee.id)
+            .limit(chunk_size)
+        )
+        ids = (await db.execute(query)).scalars().all()
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+async def bulk_write_employees(
+    db: AsyncSession,
+    selection: EmployeeSelection,
+    statement,
+    chunk_size: int,
+    tombstones: bool = False,
+    progress=None,
+    after_id: int = 0,
+    affected: int = 0,
+):
+    # every chunk is its own transaction so row locks are held briefly;
+    # chunks go in id order, so after_id resumes an interrupted run
+    dialect = db.get_bind().dialect.name
+    statement = statement.execution_options(synchronize_session=False)
+    clauses = []
+    if selection.filter is not None:
+        clauses = filter_clauses(selection.filter, dialect=dialect)
+    async for ids in selected_id_chunks(
+        db=db, selection=selection, chunk_size=chunk_size, after_id=after_id
+    ):
+        chunk_clauses = [*clauses, ids_clause(ids, dialect)]
+        if tombstones:
+            deleted = select(Employee.id).where(*chunk_clauses)
+            await db.execute(
+                insert(EmployeeTombstone).from_select(["employee_id"], deleted)
+            )
+        chunk_statement, stamp = statement, None
+        if isinstance(statement, Update):
+            # stamped per chunk: chunks commit one by one, and the change feed
+            # must not get a chunk older than one it has already passed
+            stamp = datetime.utcnow()
+            chunk_statement = statement.values(updated_at=stamp)
+        result = await db.execute(chunk_statement.where(*chunk_clauses))
+        affected += result.rowcount
+        if progress is not None:
+            # commits the chunk together with its checkpoint
+            await progress(affected, checkpoint=ids[-1])
+        else:
+            await db.commit()
+        await forget_employees(ids, version=stamp)
+    await employees_changed()
+    return affected
+
+
+async def bulk_delete_employees(
+    db: AsyncSession,
+    selection: EmployeeSelection,
+    chunk_size: int = BULK_CHUNK_SIZE,
+    progress=None,
+    after_id: int = 0,
+    affected: int = 0,
+):
+    affected = await bulk_write_employees(
+        db=db,
+        selection=selection,
+        statement=delete(Employee),
+        chunk_size=chunk_size,
+        tombstones=True,
+        progress=progress,
+        after_id=after_id,
+        affected=affected,
+    )
+    return {"affected": affected}
+
+
+async def bulk_patch_employees(
+    db: AsyncSession,
+    selection: EmployeeBulkUpdate,
+    chunk_size: int = BULK_CHUNK_SIZE,
+    progress=None,
+    after_id: int = 0,
+    affected: int = 0,
+):
+    changes = {
+        var: value
+        for var, value in selection.changes.dict(exclude_unset=True).items()
+        if value is not None
+    }
+    validate_employee_data(changes)
+    statement = update(Employee).values(**changes)
+    affected = await bulk_write_employees(
+        db=db,
+        selection=selection,
+        statement=statement,
+        chunk_size=chunk_size,
+        progress=progress,
+        after_id=after_id,
+        affected=affected,
+    )
+    return {"affected": affected}
@@ -0,0 +1,25 @@
+from db.models.employee import Employee
+from schemas.employee import EmployeeFilter
+
+
+def filter_clauses(filters: EmployeeFilter, dialect: str):
+    clauses = []
+    if filters.role is not None:
+        clauses.append(Employee.role == filters.role)
+    if filters.min_age is not None:
+        clauses.append(Employee.age >= filters.min_age)
+    if filters.max_age is not None:
+        clauses.append(Employee.age <= filters.max_age)
+    if filters.min_salary is not None:
+        clauses.append(Employee.salary >= filters.min_salary)
+    if filters.max_salary is not None:
+        clauses.append(Employee.salary <= filters.max_salary)
+    if filters.name_prefix:
+        clauses.append(Employee.name.startswith(filters.name_prefix, autoescape=True))
+    if filters.search:
+        if dialect == "postgresql":
+            # pg_trgm similarity, served by the ix_employees_name_trgm GIN index
+            clauses.append(Employee.name.op("%")(filters.search))
+        else:
+            clauses.append(Employee.name.contains(filters.search, autoescape=True))
+    return clauses
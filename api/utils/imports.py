@@ -0,0 +1,219 @@
+import codecs
+import csv
+import json
+from collections import deque
+import logging
+import os
+import time
+from datetime import datetime
+from typing import AsyncIterator, List
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models.employee import Employee, Role, employee_errors
+from schemas.employee import EmployeeCreate, EmployeeImportResult, ExportFormat
+from api.utils.employees import UPSERT_FIELDS, employees_changed
+from api.utils.employees import get_ids_by_phone_number
+
+logger = logging.getLogger("api.imports")
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 5000))
+IMPORT_MAX_ERRORS = 100
+IMPORT_FIELDS = ("name", "age", "role", "salary", "phone_number")
+STAGING_TABLE = "employees_import"
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    tail = ""
+    async for chunk in chunks:
+        lines = (tail + decoder.decode(chunk)).split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+class LineFeed(deque):
+    # csv.reader input that can run dry and be refilled, unlike a generator
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self:
+            raise StopIteration
+        return self.popleft()
+
+
+async def iter_records(lines: AsyncIterator[str], format: ExportFormat):
+    # (line number, dict) pairs; CSV files need a header row
+    feed = LineFeed()
+    reader = csv.reader(feed)
+    header = None
+    number = start = quotes = 0
+    async for line in lines:
+        number += 1
+        line = line.rstrip("\r")
+        if not quotes:
+            if not line.strip():
+                continue
+            start = number
+        if format == ExportFormat.ndjson:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield number, record
+            continue
+        # a quoted field is still open while the record has an odd quote count
+        feed.append(line + "\n")
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        quotes = 0
+        values = next(reader, None)
+        feed.clear()
+        if header is None:
+            header = values or []
+            missing = [field for field in IMPORT_FIELDS if field not in header]
+            if missing:
+                raise HTTPException(
+                    status_code=400, detail=f"CSV header is missing {missing}"
+                )
+            continue
+        yield start, dict(zip(header, values or []))
+    if feed:
+        yield start, None
+
+
+def validate_records(records):
+    rows, errors = [], []
+    for number, record in records:
+        if not isinstance(record, dict):
+            errors.append({"line": number, "detail": "Invalid record"})
+            continue
+        try:
+            employee = EmployeeCreate.parse_obj(record)
+        except ValidationError as error:
+            first = error.errors()[0]
+            field = ".".join(str(part) for part in first["loc"])
+            errors.append({"line": number, "detail": f"{field}: {first['msg']}"})
+            continue
+        rows.append((number, employee.dict()))
+    valid = []
+    for (number, row), error in zip(rows, employee_errors(row for _, row in rows)):
+        if error:
+            errors.append({"line": number, "detail": error})
+        else:
+            valid.append(row)
+    errors.sort(key=lambda error: error["line"])
+    return valid, errors
+
+
+async def copy_chunk(db: AsyncSession, rows: List[dict], now: datetime):
+    # the staging table lives as long as the pooled connection, its rows until commit
+    role_type = Employee.__table__.c.role.type.name
+    await db.execute(
+        text(
+            f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (seq integer, "
+            f"name varchar(100), age integer, role {role_type}, salary integer, "
+            "phone_number varchar(25)) ON COMMIT DELETE ROWS"
+        )
+    )
+    connection = await (await db.connection()).get_raw_connection()
+    await connection.driver_connection.copy_records_to_table(
+        STAGING_TABLE,
+        records=[
+            (
+                seq,
+                row["name"],
+                row["age"],
+                Role(row["role"]).name,
+                row["salary"],
+                row["phone_number"],
+            )
+            for seq, row in enumerate(rows)
+        ],
+        columns=["seq", *IMPORT_FIELDS],
+    )
+    # the last row wins when a phone number repeats within the chunk
+    columns = ", ".join(IMPORT_FIELDS)
+    result = await db.execute(
+        text(
+            f"INSERT INTO employees ({columns}, created_at, updated_at) "
+            f"SELECT DISTINCT ON (phone_number) {columns}, "
+            "CAST(:now AS timestamp), CAST(:now AS timestamp) "
+            f"FROM {STAGING_TABLE} ORDER BY phone_number, seq DESC "
+            "ON CONFLICT (phone_number) DO UPDATE SET "
+            + ", ".join(f"{field} = excluded.{field}" for field in UPSERT_FIELDS)
+            + " RETURNING id, xmax = 0"
+        ),
+        {"now": now},
+    )
+    return [employee_id for employee_id, created in result if not created]
+
+
+async def executemany_chunk(db: AsyncSession, rows: List[dict], now: datetime):
+    statement = sqlite.insert(Employee)
+    statement = statement.on_conflict_do_update(
+        index_elements=[Employee.phone_number],
+        set_={field: statement.excluded[field] for field in UPSERT_FIELDS},
+    )
+    phone_numbers = [row["phone_number"] for row in rows]
+    existing = await get_ids_by_phone_number(db=db, phone_numbers=phone_numbers)
+    await db.execute(
+        statement, [dict(row, created_at=now, updated_at=now) for row in rows]
+    )
+    return list(existing.values())
+
+
+async def import_employees(
+    db: AsyncSession,
+    lines: AsyncIterator[str],
+    format: ExportFormat,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    progress=None,
+):
+    load_chunk = (
+        copy_chunk if db.get_bind().dialect.name == "postgresql" else executemany_chunk
+    )
+    report = {"processed": 0, "imported": 0, "failed": 0, "errors": []}
+    started = time.perf_counter()
+
+    async def flush(records):
+        rows, errors = validate_records(records)
+        if rows:
+            now = datetime.utcnow()
+            updated = await load_chunk(db=db, rows=rows, now=now)
+            await db.commit()
+            await employees_changed(*updated, version=now)
+        report["processed"] += len(records)
+        report["imported"] += len(rows)
+        report["failed"] += len(errors)
+        room = IMPORT_MAX_ERRORS - len(report["errors"])
+        report["errors"].extend(errors[:room])
+        elapsed = time.perf_counter() - started
+        report["elapsed"] = round(elapsed, 3)
+        report["rows_per_second"] = round(report["processed"] / elapsed, 1)
+        logger.info(
+            "imported %d of %d rows (%.0f rows/sec)",
+            report["imported"],
+            report["processed"],
+            report["rows_per_second"],
+        )
+        if progress is not None:
+            await progress(report)
+
+    records = []
+    async for record in iter_records(lines, format):
+        records.append(record)
+        if len(records) >= chunk_size:
+            await flush(records)
+            records = []
+    if records or not report["processed"]:
+        await flush(records)
+    return EmployeeImportResult(**report)
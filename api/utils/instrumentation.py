@@ -0,0 +1,231 @@
+import contextvars
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import resource
+import time
+from collections import defaultdict, deque
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger("api.instrumentation")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 100))
+PROFILE_PATHS = tuple(
+    path for path in os.getenv("PROFILE_PATHS", "").split(",") if path
+)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0.01))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    @property
+    def route(self):
+        route = self.scope.get("route")
+        return route.path if route is not None else "<unmatched>"
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.statuses = defaultdict(int)
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    def observe(self, status: int, seconds: float, stats: RequestStats):
+        self.statuses[status] += 1
+        self.count += 1
+        self.seconds += seconds
+        self.queries += stats.queries
+        self.db_seconds += stats.db_seconds
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.routes = defaultdict(RouteMetrics)
+        self.slow_queries = deque(maxlen=50)
+        self.profiles = deque(maxlen=10)
+        self.collectors = {}
+
+    def register(self, name: str, kind: str, collect):
+        self.collectors[name] = (kind, collect)
+
+    def observe(self, method: str, route: str, status: int, seconds, stats):
+        self.routes[(method, route)].observe(status, seconds, stats)
+
+    def render(self):
+        lines = [
+            "# TYPE http_requests_total counter",
+            "# TYPE http_request_duration_seconds histogram",
+            "# TYPE db_queries_total counter",
+            "# TYPE db_query_duration_seconds_total counter",
+        ]
+        for (method, route), metrics in sorted(self.routes.items()):
+            labels = f'method="{method}",route="{route}"'
+            for status, count in sorted(metrics.statuses.items()):
+                lines.append(
+                    f'http_requests_total{{{labels},status="{status}"}} {count}'
+                )
+            for bound, count in zip(LATENCY_BUCKETS, metrics.buckets):
+                lines.append(
+                    f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}}'
+                    f" {count}"
+                )
+            lines += [
+                f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}}'
+                f" {metrics.count}",
+                f"http_request_duration_seconds_sum{{{labels}}} {metrics.seconds}",
+                f"http_request_duration_seconds_count{{{labels}}} {metrics.count}",
+                f"db_queries_total{{{labels}}} {metrics.queries}",
+                f"db_query_duration_seconds_total{{{labels}}} {metrics.db_seconds}",
+            ]
+        for name, (kind, collect) in sorted(self.collectors.items()):
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in collect():
+                label_text = ",".join(f'{key}="{text}"' for key, text in labels)
+                lines.append(f"{name}{{{label_text}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def process_start_time():
+    # a forked worker's start time covers importing and building the app
+    try:
+        with open("/proc/self/stat") as file:
+            ticks = int(file.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as file:
+            boot = next(int(line.split()[1]) for line in file if line[:5] == "btime")
+        return boot + ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return time.time()
+
+
+def resident_memory_bytes():
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # peak rather than current RSS, in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ProcessStats:
+    def __init__(self):
+        self.started_at = process_start_time()
+        self.startup_seconds = None
+
+    def ready(self):
+        self.startup_seconds = time.time() - self.started_at
+        logger.info(
+            "worker %d ready in %.2fs, rss %.1f MiB",
+            os.getpid(),
+            self.startup_seconds,
+            resident_memory_bytes() / 2**20,
+        )
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "startup_seconds": self.startup_seconds,
+            "resident_memory_bytes": resident_memory_bytes(),
+        }
+
+
+registry = MetricsRegistry()
+process_stats = ProcessStats()
+request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+def instrument_engine(engine):
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        seconds = time.perf_counter() - conn.info["query_started"].pop()
+        stats = request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += seconds
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            registry.slow_queries.append(
+                {
+                    "route": stats.route if stats is not None else None,
+                    "duration_ms": round(seconds * 1000, 2),
+                    "statement": statement[:1000],
+                }
+            )
+
+
+class InstrumentationMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.profiling = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = request_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                app_ms = (time.perf_counter() - started) * 1000
+                db_ms = stats.db_seconds * 1000
+                MutableHeaders(scope=message).append(
+                    "Server-Timing",
+                    f"app;dur={app_ms:.1f}, "
+                    f'db;dur={db_ms:.1f};desc="{stats.queries} queries"',
+                )
+            await send(message)
+
+        profiler = None
+        if scope["path"].startswith(PROFILE_PATHS or ()) and not self.profiling:
+            if random.random() < PROFILE_SAMPLE_RATE:
+                profiler = cProfile.Profile()
+                self.profiling = True
+                profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            seconds = time.perf_counter() - started
+            registry.observe(scope["method"], stats.route, status, seconds, stats)
+            request_stats.reset(token)
+            if profiler is not None:
+                profiler.disable()
+                self.profiling = False
+                self.record_profile(profiler, scope["method"], stats.route, seconds)
+
+    def record_profile(self, profiler, method: str, route: str, seconds: float):
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(25)
+        registry.profiles.append(
+            {
+                "route": f"{method} {route}",
+                "duration_ms": round(seconds * 1000, 2),
+                "stats": output.getvalue(),
+            }
+        )
+        logger.info("profiled %s %s in %.1f ms", method, route, seconds * 1000)
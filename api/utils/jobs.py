@@ -0,0 +1,339 @@
+import asyncio
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from sqlalchemy import Integer, and_, cast, func, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from db.config import SessionLocal, env_int
+from db.models.employee import Employee
+from db.models.job import Job
+from schemas.employee import (
+    EmployeeBulkUpdate,
+    EmployeeCreate,
+    EmployeeFilter,
+    EmployeeSelection,
+)
+from schemas.job import SalaryAdjustment
+from api.utils.employees import (
+    BULK_CHUNK_SIZE,
+    bulk_delete_employees,
+    bulk_patch_employees,
+    bulk_upsert_employees,
+    bulk_write_employees,
+)
+from api.utils.filters import filter_clauses
+
+logger = logging.getLogger("api.jobs")
+
+# set JOB_CONCURRENCY=0 on processes that should only accept jobs
+JOB_CONCURRENCY = env_int("JOB_CONCURRENCY", 2)
+JOB_CHUNK_SIZE = env_int("JOB_CHUNK_SIZE", BULK_CHUNK_SIZE)
+JOB_MAX_ITEMS = env_int("JOB_MAX_ITEMS", 100000)
+# jobs queued by other processes are picked up by polling at this interval
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 5))
+# a running job whose heartbeat is older than this is assumed lost and
+# re-run from its checkpoint
+JOB_STALE_SECONDS = env_int("JOB_STALE_SECONDS", 300)
+JOB_HEARTBEAT_SECONDS = env_int("JOB_HEARTBEAT_SECONDS", 30)
+
+handlers = {}
+
+
+def job_handler(kind: str):
+    def register(handler):
+        handlers[kind] = handler
+        return handler
+
+    return register
+
+
+def claimable():
+    stale = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+    heartbeat = func.coalesce(Job.heartbeat_at, Job.updated_at)
+    return or_(Job.status == "queued", and_(Job.status == "running", heartbeat < stale))
+
+
+async def get_job(db: AsyncSession, job_id: int):
+    job = await db.get(Job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found!")
+    return job
+
+
+async def get_job_result(db: AsyncSession, job_id: int):
+    job = await get_job(db=db, job_id=job_id)
+    if job.status in ("queued", "running"):
+        raise HTTPException(status_code=409, detail="Job has not finished yet")
+    return {"id": job.id, "status": job.status, "result": job.result}
+
+
+async def submit_job(db: AsyncSession, kind: str, params: dict):
+    job = Job(kind=kind, params=params)
+    db.add(job)
+    await db.commit()
+    job_runner.enqueue(job.id)
+    return job
+
+
+async def next_job_id(db: AsyncSession):
+    query = select(Job.id).where(claimable()).order_by(Job.id).limit(1)
+    return await db.scalar(query)
+
+
+async def claim_job(db: AsyncSession, job_id: int):
+    # only one worker, in any process, wins the update
+    now = datetime.utcnow()
+    statement = (
+        update(Job)
+        .where(Job.id == job_id, claimable())
+        .values(status="running", started_at=now, updated_at=now, heartbeat_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(statement)
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def finish_job(db: AsyncSession, job_id: int, **values):
+    now = datetime.utcnow()
+    statement = (
+        update(Job)
+        .where(Job.id == job_id)
+        .values(**values, finished_at=now, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(statement)
+    await db.commit()
+
+
+class JobProgress:
+    def __init__(self, db: AsyncSession, job: Job):
+        self.db = db
+        self.job_id = job.id
+        self.processed = job.processed
+        # None until the first chunk of a run has been committed
+        self.checkpoint = job.checkpoint
+
+    async def __call__(self, processed: int, total: int = None, checkpoint=None):
+        # commits the caller's pending writes together with the progress
+        now = datetime.utcnow()
+        values = {"processed": processed, "updated_at": now, "heartbeat_at": now}
+        if total is not None:
+            values["total"] = total
+        if checkpoint is not None:
+            values["checkpoint"] = checkpoint
+            self.checkpoint = checkpoint
+        self.processed = processed
+        statement = (
+            update(Job)
+            .where(Job.id == self.job_id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.execute(statement)
+        await self.db.commit()
+
+
+async def selection_total(db: AsyncSession, selection: EmployeeSelection):
+    if selection.ids is not None:
+        return len(set(selection.ids))
+    dialect = db.get_bind().dialect.name
+    query = select(func.count(Employee.id)).where(
+        *filter_clauses(selection.filter, dialect=dialect)
+    )
+    return await db.scalar(query)
+
+
+@job_handler("salary_adjustment")
+async def adjust_salaries(db: AsyncSession, params: dict, progress):
+    adjustment = SalaryAdjustment(**params)
+    selection = EmployeeSelection(filter=EmployeeFilter(role=adjustment.role))
+    if progress.checkpoint is None:
+        await progress(0, await selection_total(db=db, selection=selection))
+    multiplier = 1 + adjustment.percent / 100
+    statement = update(Employee).values(
+        salary=cast(func.round(Employee.salary * multiplier), Integer)
+    )
+    # not idempotent: chunks committed before a restart are skipped, never re-run
+    affected = await bulk_write_employees(
+        db=db,
+        selection=selection,
+        statement=statement,
+        chunk_size=JOB_CHUNK_SIZE,
+        progress=progress,
+        after_id=progress.checkpoint or 0,
+        affected=progress.processed,
+    )
+    return {"affected": affected}
+
+
+@job_handler("bulk_upsert")
+async def upsert_employees(db: AsyncSession, params: dict, progress):
+    employees = [EmployeeCreate(**employee) for employee in params["employees"]]
+    checkpoint = progress.checkpoint
+    if checkpoint is None:
+        checkpoint = {"index": 0, "counts": {}, "errors": []}
+        await progress(0, len(employees))
+    counts, errors = Counter(checkpoint["counts"]), checkpoint["errors"]
+    for start in range(checkpoint["index"], len(employees), JOB_CHUNK_SIZE):
+        chunk = employees[start : start + JOB_CHUNK_SIZE]
+        results = await bulk_upsert_employees(
+            db=db, employees=chunk, update_existing=params["update_existing"]
+        )
+        for result in results:
+            counts[result.status] += 1
+            if result.status == "error":
+                errors.append(dict(result.dict(), index=start + result.index))
+        # upserts are idempotent, so a chunk repeated after a crash is harmless
+        done = start + len(chunk)
+        await progress(
+            done,
+            checkpoint={"index": done, "counts": dict(counts), "errors": errors},
+        )
+    return {"counts": dict(counts), "errors": errors}
+
+
+@job_handler("bulk_patch")
+async def patch_employees(db: AsyncSession, params: dict, progress):
+    selection = EmployeeBulkUpdate(**params)
+    if progress.checkpoint is None:
+        await progress(0, await selection_total(db=db, selection=selection))
+    return await bulk_patch_employees(
+        db=db,
+        selection=selection,
+        chunk_size=JOB_CHUNK_SIZE,
+        progress=progress,
+        after_id=progress.checkpoint or 0,
+        affected=progress.processed,
+    )
+
+
+@job_handler("bulk_delete")
+async def delete_employees(db: AsyncSession, params: dict, progress):
+    selection = EmployeeSelection(**params)
+    if progress.checkpoint is None:
+        await progress(0, await selection_total(db=db, selection=selection))
+    return await bulk_delete_employees(
+        db=db,
+        selection=selection,
+        chunk_size=JOB_CHUNK_SIZE,
+        progress=progress,
+        after_id=progress.checkpoint or 0,
+        affected=progress.processed,
+    )
+
+
+class JobRunner:
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        # tests point this at their own database
+        self.session_factory = SessionLocal
+        self.loop = None
+        self.queue = None
+        self.workers = []
+        self.running = 0
+        self.current = set()
+        self.finished = Counter()
+
+    def start(self):
+        # workers are bound to the event loop they were started on
+        loop = asyncio.get_running_loop()
+        if self.loop is loop:
+            return
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self.workers = [loop.create_task(self.work()) for _ in range(self.concurrency)]
+
+    def enqueue(self, job_id: int):
+        self.start()
+        self.queue.put_nowait(job_id)
+
+    async def stop(self):
+        interrupted = list(self.current)
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.loop = None
+        self.workers = []
+        if interrupted:
+            # hand them to the next worker now instead of after JOB_STALE_SECONDS
+            await self.requeue(interrupted)
+
+    async def requeue(self, job_ids):
+        statement = (
+            update(Job)
+            .where(Job.id.in_(job_ids), Job.status == "running")
+            .values(status="queued", heartbeat_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        try:
+            async with self.session_factory() as db:
+                await db.execute(statement)
+                await db.commit()
+        except Exception:
+            logger.exception("could not requeue jobs %s", job_ids)
+
+    async def heartbeat(self, job_id: int):
+        statement = (
+            update(Job)
+            .where(Job.id == job_id, Job.status == "running")
+            .execution_options(synchronize_session=False)
+        )
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                # own session: the job's one is in the middle of a chunk
+                async with self.session_factory() as db:
+                    await db.execute(statement.values(heartbeat_at=datetime.utcnow()))
+                    await db.commit()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("heartbeat of job %d failed", job_id)
+
+    async def work(self):
+        while True:
+            try:
+                job_id = await asyncio.wait_for(self.queue.get(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                job_id = None
+            try:
+                async with self.session_factory() as db:
+                    if job_id is None:
+                        job_id = await next_job_id(db)
+                    if job_id is not None and await claim_job(db, job_id):
+                        await self.run(db, job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("job worker failed")
+
+    async def run(self, db: AsyncSession, job_id: int):
+        job = await db.get(Job, job_id)
+        self.running += 1
+        self.current.add(job_id)
+        heartbeat = asyncio.create_task(self.heartbeat(job_id))
+        try:
+            result = await handlers[job.kind](db, job.params, JobProgress(db, job))
+        except HTTPException as error:
+            await db.rollback()
+            await finish_job(db, job_id, status="failed", error=str(error.detail))
+            self.finished["failed"] += 1
+        except Exception as error:
+            logger.exception("job %d (%s) failed", job_id, job.kind)
+            await db.rollback()
+            await finish_job(db, job_id, status="failed", error=repr(error))
+            self.finished["failed"] += 1
+        else:
+            await finish_job(db, job_id, status="succeeded", result=result)
+            self.finished["succeeded"] += 1
+        finally:
+            heartbeat.cancel()
+            self.current.discard(job_id)
+            self.running -= 1
+
+
+job_runner = JobRunner(concurrency=JOB_CONCURRENCY)
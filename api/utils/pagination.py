@@ -0,0 +1,90 @@
+import base64
+import binascii
+import json
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+from db.models.employee import Employee
+
+# Only indexed columns may be used as sort keys, so every page is an index seek.
+SORTABLE_FIELDS = {
+    "id": Employee.id,
+    "name": Employee.name,
+    "age": Employee.age,
+    "salary": Employee.salary,
+}
+MAX_SORT_FIELDS = 3
+
+
+def parse_sort(sort: str):
+    keys = []
+    for part in sort.split(","):
+        part = part.strip()
+        field = part.lstrip("-")
+        if field not in SORTABLE_FIELDS or field in dict(keys):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid sort field! Available fields: {list(SORTABLE_FIELDS)}",
+            )
+        keys.append((field, part.startswith("-")))
+    if len(keys) > MAX_SORT_FIELDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_SORT_FIELDS} sort fields are allowed",
+        )
+    if "id" not in dict(keys):
+        keys.append(("id", keys[-1][1]))  # tie-breaker keeps the order total
+    return keys
+
+
+def order_clauses(keys):
+    return [
+        SORTABLE_FIELDS[field].desc() if descending else SORTABLE_FIELDS[field]
+        for field, descending in keys
+    ]
+
+
+def seek_clause(keys, values):
+    # (a, b) > (x, y) expanded to a >= x AND (a > x OR (a = x AND b > y)),
+    # which works for mixed directions and lets the planner seek on `a`.
+    alternatives = []
+    for position, (field, descending) in enumerate(keys):
+        column = SORTABLE_FIELDS[field]
+        equal = [
+            SORTABLE_FIELDS[previous] == value
+            for (previous, _), value in zip(keys[:position], values[:position])
+        ]
+        value = values[position]
+        alternatives.append(
+            and_(*equal, column < value if descending else column > value)
+        )
+    leading, descending = keys[0]
+    column = SORTABLE_FIELDS[leading]
+    bound = column <= values[0] if descending else column >= values[0]
+    return and_(bound, or_(*alternatives))
+
+
+def encode_cursor(sort: str, employee: dict):
+    values = [employee[field] for field, _ in parse_sort(sort)]
+    payload = json.dumps({"s": sort, "v": values}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, sort: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        values = payload["v"]
+        cursor_sort = payload["s"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    keys = parse_sort(sort)
+    if cursor_sort != sort or len(values) != len(keys):
+        raise HTTPException(
+            status_code=400, detail="Cursor does not match the requested sort"
+        )
+    for (field, _), value in zip(keys, values):
+        # exact type check: bools are ints in Python but never valid sort values
+        if type(value) is not SORTABLE_FIELDS[field].type.python_type:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
@@ -0,0 +1,40 @@
+import asyncio
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = {}
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key, call):
+        future = self.calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(call())
+            self.calls[key] = future
+            self.executed += 1
+            future.add_done_callback(lambda done: self.finish(key, done))
+        else:
+            self.shared += 1
+        # a cancelled caller must not cancel the call the others are awaiting
+        return await asyncio.shield(future)
+
+    def finish(self, key, future):
+        if self.calls.get(key) is future:
+            del self.calls[key]
+
+    def forget(self, *keys):
+        # later callers start a fresh call instead of joining one begun before a write
+        for key in keys:
+            self.calls.pop(key, None)
+
+    def clear(self):
+        self.calls.clear()
+
+    def stats(self):
+        return {
+            "in_flight": len(self.calls),
+            "executed": self.executed,
+            "shared": self.shared,
+        }
@@ -0,0 +1,106 @@
+import os
+from typing import List
+from sqlalchemy import Float, case, cast, func, literal_column
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from db.models.employee import Employee, Role
+from schemas.employee import EmployeeStats, StatsGroup
+from api.utils.cache import LRUCache
+
+PERCENTILES = {"p50_salary": 0.5, "p90_salary": 0.9, "p99_salary": 0.99}
+
+stats_cache = LRUCache(maxsize=64, ttl=float(os.getenv("STATS_CACHE_TTL", 60)))
+
+
+def group_expression(group_by: StatsGroup, band_width: int):
+    if group_by == StatsGroup.role:
+        return Employee.role
+    # inline the width: Postgres only matches GROUP BY to the select list when
+    # the expressions are identical, which separate bind parameters are not
+    width = literal_column(str(int(band_width)))
+    return (Employee.age / width) * width  # integer division
+
+
+def group_label(group_by: StatsGroup, band_width: int, value):
+    if group_by == StatsGroup.role:
+        return Role(value).name if value is not None else "none"
+    return f"{value}-{value + band_width - 1}"
+
+
+def postgresql_stats_query(group):
+    return select(
+        group,
+        func.count(),
+        func.avg(Employee.salary),
+        func.min(Employee.salary),
+        func.max(Employee.salary),
+        *(
+            func.percentile_disc(fraction).within_group(Employee.salary)
+            for fraction in PERCENTILES.values()
+        ),
+    ).group_by(group)
+
+
+def window_stats_query(group):
+    # no ordered-set aggregates (SQLite): nearest-rank percentiles from row_number
+    ranked = select(
+        group.label("group"),
+        Employee.salary,
+        func.row_number()
+        .over(partition_by=group, order_by=Employee.salary)
+        .label("rank"),
+        func.count().over(partition_by=group).label("total"),
+    ).subquery()
+    return select(
+        ranked.c.group,
+        func.count(),
+        func.avg(ranked.c.salary),
+        func.min(ranked.c.salary),
+        func.max(ranked.c.salary),
+        *(
+            func.min(
+                case(
+                    (
+                        ranked.c.rank >= cast(ranked.c.total, Float) * fraction,
+                        ranked.c.salary,
+                    )
+                )
+            )
+            for fraction in PERCENTILES.values()
+        ),
+    ).group_by(ranked.c.group)
+
+
+async def get_employee_stats(
+    db: AsyncSession, group_by: StatsGroup, band_width: int = 10
+) -> List[EmployeeStats]:
+    key = f"{group_by.value}:{band_width}"
+    cached = await stats_cache.get(key)
+    if cached is not None:
+        return cached
+
+    group = group_expression(group_by, band_width)
+    if db.get_bind().dialect.name == "postgresql":
+        query = postgresql_stats_query(group)
+    else:
+        query = window_stats_query(group)
+    result = await db.execute(query)
+
+    rows = sorted(result, key=lambda row: (row[0] is None, row[0] or 0))
+    stats = [
+        EmployeeStats(
+            group=group_label(group_by, band_width, value),
+            count=count,
+            avg_salary=avg,
+            min_salary=minimum,
+            max_salary=maximum,
+            **dict(zip(PERCENTILES, percentiles)),
+        )
+        for value, count, avg, minimum, maximum, *percentiles in rows
+    ]
+    await stats_cache.set(key, stats)
+    return stats
+
+
+async def invalidate_employee_stats():
+    await stats_cache.clear()
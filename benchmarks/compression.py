@@ -0,0 +1,81 @@
+"""Compare bytes on the wire and CPU per request across projections and encodings.
+
+    python -m benchmarks.compression --rows 10000 --requests 200
+
+Requests go through the in-process ASGI app, so CPU time is the whole
+request (query, serialization and compression) on one core; the raw,
+still-compressed body is read so client-side decoding is not counted.
+The database is reseeded from --db-url or BENCH_DATABASE_URL.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from benchmarks.seed import BENCH_DATABASE_URL, seed
+
+VARIANTS = {
+    "list": "/employees?limit=100",
+    "list_id_name": "/employees?limit=100&fields=id,name",
+    "export": "/employees/export",
+}
+
+
+async def measure(client, url: str, encoding: str, requests: int):
+    wire_bytes = 0
+    started_cpu, started = time.process_time(), time.perf_counter()
+    for _ in range(requests):
+        async with client.stream(
+            "GET", url, headers={"Accept-Encoding": encoding}
+        ) as response:
+            async for chunk in response.aiter_raw():
+                wire_bytes += len(chunk)
+    cpu = time.process_time() - started_cpu
+    elapsed = time.perf_counter() - started
+    return {
+        "bytes": wire_bytes // requests,
+        "cpu_ms": round(cpu / requests * 1000, 3),
+        "latency_ms": round(elapsed / requests * 1000, 3),
+    }
+
+
+async def run(args):
+    # the in-process app reads DATABASE_URL on import
+    os.environ["DATABASE_URL"] = args.db_url
+    await seed(args.db_url, args.rows)
+
+    from api.utils.compression import ENCODERS
+    from main import app
+
+    encodings = ["identity", *reversed(ENCODERS)]
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        for variant, url in VARIANTS.items():
+            requests = (
+                max(1, args.requests // 20) if variant == "export" else args.requests
+            )
+            await measure(client, url, "identity", requests)  # warm up
+            baseline = None
+            for encoding in encodings:
+                report = await measure(client, url, encoding, requests)
+                baseline = baseline or report
+                ratio = report["bytes"] / baseline["bytes"]
+                print(
+                    f"{variant:14} {encoding:9} {report['bytes']:>10,} B"
+                    f"  ({ratio:6.1%})  cpu {report['cpu_ms']:>8} ms"
+                    f"  ({report['cpu_ms'] - baseline['cpu_ms']:+.3f})"
+                    f"  latency {report['latency_ms']:>8} ms"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--db-url", default=BENCH_DATABASE_URL)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Load-test every employee route and compare against a saved baseline.
+
+    # in-process ASGI client against a freshly seeded SQLite file
+    python -m benchmarks.load --rows 10000 --concurrency 20 --save baseline.json
+    # real uvicorn workers, failing on regressions against that baseline
+    python -m benchmarks.load --workers 4 --compare baseline.json
+
+The database is seeded from scratch, so it is chosen by --db-url or
+BENCH_DATABASE_URL (default sqlite+aiosqlite:///bench.db), never DATABASE_URL.
+With --url the server is assumed to be seeded already; add --seed to seed
+--db-url, which must then be that server's database.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.seed import BENCH_DATABASE_URL, seed, seed_phone_number
+
+READ_SCENARIOS = (
+    "list",
+    "list_deep_offset",
+    "list_deep_cursor",
+    "list_filtered",
+    "get",
+    "stats",
+    "export",
+)
+WRITE_SCENARIOS = ("create", "bulk", "put", "patch", "delete")
+SCENARIOS = READ_SCENARIOS + WRITE_SCENARIOS
+# whole-table requests get fewer iterations than point requests
+REQUEST_SHARE = {"export": 0.01, "bulk": 0.1}
+
+
+class Context:
+    def __init__(self, rows: int):
+        self.rows = rows
+        self.run_id = int(time.time()) % 100000
+        self.created = 0
+        self.next_delete_id = rows
+        self.deep_cursor = None
+
+    def random_id(self):
+        return random.randint(1, self.rows // 2)
+
+    def new_employee(self):
+        self.created += 1
+        return {
+            "name": "Benchmark",
+            "age": random.randint(20, 65),
+            "role": random.randint(1, 4),
+            "salary": random.randint(50000, 500000),
+            "phone_number": f"+8{self.run_id:05d}{self.created:07d}",
+        }
+
+    def request(self, scenario: str):
+        if scenario == "list":
+            return "GET", "/employees?limit=100", None
+        if scenario == "list_deep_offset":
+            return "GET", f"/employees?skip={self.rows - 100}&limit=100", None
+        if scenario == "list_deep_cursor":
+            return "GET", f"/employees?limit=100&cursor={self.deep_cursor}", None
+        if scenario == "list_filtered":
+            query = "role=2&min_age=30&max_age=40&min_salary=100000&limit=100"
+            return "GET", f"/employees?{query}", None
+        if scenario == "get":
+            return "GET", f"/employees/{self.random_id()}", None
+        if scenario == "stats":
+            return "GET", "/employees/stats?group_by=age_band", None
+        if scenario == "export":
+            return "GET", "/employees/export", None
+        if scenario == "create":
+            return "POST", "/employees", self.new_employee()
+        if scenario == "bulk":
+            return "POST", "/employees/bulk", [self.new_employee() for _ in range(100)]
+        if scenario == "put":
+            employee_id = self.random_id()
+            body = dict(
+                self.new_employee(), phone_number=seed_phone_number(employee_id - 1)
+            )
+            return "PUT", f"/employees/{employee_id}", body
+        if scenario == "patch":
+            body = {"salary": random.randint(50000, 500000)}
+            return "PATCH", f"/employees/{self.random_id()}", body
+        if scenario == "delete":
+            self.next_delete_id -= 1
+            return "DELETE", f"/employees/{self.next_delete_id + 1}", None
+        raise ValueError(scenario)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+def percentile(latencies, fraction: float):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_scenario(client, context, scenario, requests, concurrency, counter):
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            method, url, body = context.request(scenario)
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            await response.aread()
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    queries = counter.count if counter else 0
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    report = {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+    if counter:
+        report["queries_per_request"] = round((counter.count - queries) / requests, 2)
+    return report
+
+
+async def wait_until_ready(client, server, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await client.get("/metrics/pool")
+            return
+        except httpx.TransportError:
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+def start_workers(workers: int, port: int):
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)]
+    command += ["--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(command, env=os.environ.copy())
+
+
+async def run(args):
+    # the in-process app and spawned workers read DATABASE_URL on import
+    os.environ["DATABASE_URL"] = args.db_url
+    if not args.url or args.seed:
+        await seed(args.db_url, args.rows)
+    context = Context(args.rows)
+    counter = None
+    server = None
+
+    if args.workers:
+        server = start_workers(args.workers, args.port)
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}")
+        await wait_until_ready(client, server)
+    elif args.url:
+        client = httpx.AsyncClient(base_url=args.url)
+    else:
+        from sqlalchemy import event
+        from db.config import engine
+        from main import app
+
+        counter = QueryCounter()
+        event.listen(engine.sync_engine, "before_cursor_execute", counter)
+        client = httpx.AsyncClient(app=app, base_url="http://bench")
+
+    try:
+        response = await client.get(f"/employees?skip={args.rows - 101}&limit=1")
+        context.deep_cursor = response.headers["X-Next-Cursor"]
+        results = {}
+        for scenario in args.scenarios:
+            requests = max(1, int(args.requests * REQUEST_SHARE.get(scenario, 1)))
+            results[scenario] = await run_scenario(
+                client, context, scenario, requests, args.concurrency, counter
+            )
+            print_row(scenario, results[scenario])
+    finally:
+        await client.aclose()
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    return {
+        "meta": {
+            "rows": args.rows,
+            "concurrency": args.concurrency,
+            "target": f"uvicorn x{args.workers}"
+            if args.workers
+            else args.url or "asgi",
+            "database": args.db_url.split(":")[0],
+        },
+        "scenarios": results,
+    }
+
+
+def print_row(scenario, report):
+    queries = report.get("queries_per_request", "-")
+    print(
+        f"{scenario:18} {report['throughput_rps']:>9} rps"
+        f"  p50 {report['p50_ms']:>8} ms  p95 {report['p95_ms']:>8} ms"
+        f"  p99 {report['p99_ms']:>8} ms  queries {queries:>5}"
+        f"  errors {report['errors']}"
+    )
+
+
+def compare(baseline, current, tolerance: float):
+    regressions = []
+    for scenario, before in baseline["scenarios"].items():
+        after = current["scenarios"].get(scenario)
+        if after is None:
+            continue
+        if after["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{scenario}: p95 {before['p95_ms']} -> {after['p95_ms']} ms"
+            )
+        if after["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{scenario}: throughput {before['throughput_rps']}"
+                f" -> {after['throughput_rps']} rps"
+            )
+        if after.get("queries_per_request", 0) > before.get("queries_per_request", 0):
+            regressions.append(
+                f"{scenario}: queries/request {before['queries_per_request']}"
+                f" -> {after['queries_per_request']}"
+            )
+        if after["errors"] > before["errors"]:
+            regressions.append(
+                f"{scenario}: errors {before['errors']} -> {after['errors']}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--workers", type=int, help="spawn uvicorn with N workers")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", help="benchmark an already running server")
+    parser.add_argument("--db-url", default=BENCH_DATABASE_URL)
+    parser.add_argument(
+        "--seed", action="store_true", help="seed --db-url before a --url run"
+    )
+    parser.add_argument("--save", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", help="fail on regressions against a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), results, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
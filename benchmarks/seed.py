@@ -0,0 +1,71 @@
+"""Seed the employees table with N deterministic rows.
+
+    BENCH_DATABASE_URL=sqlite+aiosqlite:///bench.db python -m benchmarks.seed --rows 100000
+
+Seeding drops and recreates every table, so the target comes from
+BENCH_DATABASE_URL or --db-url and never from the service's DATABASE_URL.
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+SEED_CHUNK_SIZE = 10000
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL", "sqlite+aiosqlite:///bench.db")
+
+
+def employee_row(i: int, now: datetime):
+    return {
+        "name": f"Employee {i:08d}",
+        "age": 20 + i % 45,
+        "role": 1 + i % 4,
+        "salary": 50000 + (i * 7919) % 450000,
+        "phone_number": seed_phone_number(i),
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def seed_phone_number(i: int):
+    return f"+7{i:010d}"
+
+
+async def seed(url: str, rows: int):
+    from db.config import Base
+    from db.models.employee import Employee
+    from db.models import job  # noqa: F401
+
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    for start in range(0, rows, SEED_CHUNK_SIZE):
+        chunk = range(start, min(start + SEED_CHUNK_SIZE, rows))
+        async with engine.begin() as conn:
+            await conn.execute(
+                Employee.__table__.insert(), [employee_row(i, now) for i in chunk]
+            )
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--db-url", default=BENCH_DATABASE_URL)
+    args = parser.parse_args()
+    # db.config builds its engine on import; point it at the benchmark database
+    os.environ["DATABASE_URL"] = args.db_url
+    elapsed = await seed(args.db_url, args.rows)
+    print(f"seeded {args.rows:,} employees in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
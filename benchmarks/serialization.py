@@ -0,0 +1,85 @@
+"""Rows/sec of the GET /employees list serialization, before and after.
+
+    python -m benchmarks.serialization --rows 1000 --repeat 50
+
+"before" loads ORM entities and validates them through List[Employee] with
+the stdlib JSON encoder, as FastAPI does for response_model. "after" is the
+path read_employees uses now: plain column rows encoded with orjson.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+
+from typing import List  # noqa: E402
+import orjson  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import parse_obj_as  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from sqlalchemy.future import select  # noqa: E402
+from db.config import Base  # noqa: E402
+from db.models.employee import Employee  # noqa: E402
+from schemas.employee import Employee as EmployeeSchema  # noqa: E402
+
+
+async def seed(engine, rows: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(
+            Employee.__table__.insert(),
+            [
+                {
+                    "name": f"Employee {i}",
+                    "age": 20 + i % 45,
+                    "role": 1 + i % 4,
+                    "salary": 100000 + i,
+                    "phone_number": f"+7900{i:07d}",
+                }
+                for i in range(rows)
+            ],
+        )
+
+
+async def orm_path(db: AsyncSession, limit: int):
+    result = await db.execute(select(Employee).order_by(Employee.id).limit(limit))
+    employees = parse_obj_as(List[EmployeeSchema], result.scalars().all())
+    return json.dumps(jsonable_encoder(employees)).encode()
+
+
+async def row_path(db: AsyncSession, limit: int):
+    query = select(*Employee.__table__.c).order_by(Employee.id).limit(limit)
+    result = await db.execute(query)
+    return orjson.dumps([dict(row) for row in result.mappings()])
+
+
+async def measure(engine, path, limit: int, repeat: int):
+    async with AsyncSession(engine) as db:
+        await path(db, limit)  # warm up
+        started = time.perf_counter()
+        for _ in range(repeat):
+            await path(db, limit)
+        elapsed = time.perf_counter() - started
+    return limit * repeat / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    engine = create_async_engine("sqlite+aiosqlite://")
+    await seed(engine, args.rows)
+    before = await measure(engine, orm_path, args.rows, args.repeat)
+    after = await measure(engine, row_path, args.rows, args.repeat)
+    print(f"before (ORM + response_model + json): {before:12,.0f} rows/sec")
+    print(f"after  (rows + orjson):               {after:12,.0f} rows/sec")
+    print(f"speedup: {after / before:.1f}x")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+"""Concurrent read/write throughput on SQLite, default engine vs DB_SQLITE_TUNED.
+
+    python -m benchmarks.sqlite_concurrency --readers 16 --writers 4 --seconds 5
+
+Readers fetch random employees by id, writers update a random salary and
+commit, all in one process. "default" is the engine this service created
+before the tuned profile existed: NullPool, rollback journal, deferred
+transactions. Each profile runs against a fresh database file.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+
+from sqlalchemy import select, update  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+from db.config import Base, create_engine_from_env  # noqa: E402
+from db.models.employee import Employee  # noqa: E402
+
+
+def create_engines(url: str, tuned: bool):
+    os.environ["DB_SQLITE_TUNED"] = "1" if tuned else "0"
+    try:
+        writer = create_engine_from_env(url)
+        reader = create_engine_from_env(url, readonly=True) if tuned else writer
+    finally:
+        del os.environ["DB_SQLITE_TUNED"]
+    return writer, reader
+
+
+async def seed(engine, rows: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(
+            Employee.__table__.insert(),
+            [
+                {
+                    "name": f"Employee {i}",
+                    "age": 20 + i % 45,
+                    "role": 1 + i % 4,
+                    "salary": 100000 + i,
+                    "phone_number": f"+7900{i:07d}",
+                }
+                for i in range(rows)
+            ],
+        )
+
+
+async def read_loop(engine, rows: int, deadline: float, counts):
+    while time.perf_counter() < deadline:
+        try:
+            async with AsyncSession(engine) as db:
+                employee_id = random.randint(1, rows)
+                query = select(Employee.name).where(Employee.id == employee_id)
+                (await db.execute(query)).one()
+            counts["reads"] += 1
+        except OperationalError:
+            counts["errors"] += 1
+
+
+async def write_loop(engine, rows: int, deadline: float, counts):
+    while time.perf_counter() < deadline:
+        try:
+            async with AsyncSession(engine) as db:
+                employee_id = random.randint(1, rows)
+                await db.execute(
+                    update(Employee)
+                    .where(Employee.id == employee_id)
+                    .values(salary=Employee.salary + 1)
+                )
+                await db.commit()
+            counts["writes"] += 1
+        except OperationalError:
+            counts["errors"] += 1
+
+
+async def measure(args, tuned: bool):
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite+aiosqlite:///{directory}/bench.db"
+        writer, reader = create_engines(url, tuned)
+        await seed(writer, args.rows)
+        counts = {"reads": 0, "writes": 0, "errors": 0}
+        deadline = time.perf_counter() + args.seconds
+        await asyncio.gather(
+            *(
+                read_loop(reader, args.rows, deadline, counts)
+                for _ in range(args.readers)
+            ),
+            *(
+                write_loop(writer, args.rows, deadline, counts)
+                for _ in range(args.writers)
+            ),
+        )
+        await writer.dispose()
+        await reader.dispose()
+    return {name: count / args.seconds for name, count in counts.items()}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    for name, tuned in (("default", False), ("tuned", True)):
+        report = await measure(args, tuned)
+        print(
+            f"{name:8} reads {report['reads']:>10,.0f}/s"
+            f"  writes {report['writes']:>8,.0f}/s"
+            f"  errors {report['errors']:>6,.1f}/s"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
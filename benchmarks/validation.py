@@ -0,0 +1,76 @@
+"""Per-row cost of employee validation, before and after.
+
+    python -m benchmarks.validation --rows 10000 --repeat 20
+
+"before" replays the old per-row checks, which rebuilt the role list on every
+call. "single" validates one dict at a time as the single-write routes do;
+"batch" is the bulk path.
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+
+from db.models.employee import Role, employee_data_error  # noqa: E402
+from db.models.employee import employee_errors  # noqa: E402
+
+
+def legacy_errors(rows):
+    errors = []
+    for row in rows:
+        available_roles = [role.value for role in Role]
+        if row["role"] not in available_roles:
+            errors.append(f"Invalid role! Available roles: {available_roles}")
+        elif "+" not in row["phone_number"]:
+            errors.append("Phone number must contain '+' ")
+        else:
+            errors.append(None)
+    return errors
+
+
+def single_errors(rows):
+    return [employee_data_error(row) for row in rows]
+
+
+def make_rows(count: int):
+    return [
+        {
+            "name": f"Employee {i}",
+            "age": 20 + i % 45,
+            # every 100th row is invalid
+            "role": 1 + i % 4 if i % 100 else 9,
+            "salary": 100000 + i,
+            "phone_number": f"+7900{i:07d}",
+        }
+        for i in range(count)
+    ]
+
+
+def measure(validate, rows, repeat: int):
+    validate(rows)  # warm up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        validate(rows)
+    return (time.perf_counter() - started) / (len(rows) * repeat) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    assert legacy_errors(rows) == employee_errors(rows)
+    before = measure(legacy_errors, rows, args.repeat)
+    single = measure(single_errors, rows, args.repeat)
+    batch = measure(employee_errors, rows, args.repeat)
+    print(f"before (list per row):  {before:8.0f} ns/row")
+    print(f"single (frozenset):     {single:8.0f} ns/row")
+    print(f"batch  (frozenset):     {batch:8.0f} ns/row")
+    print(f"speedup: {before / batch:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
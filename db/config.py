@@ -1,17 +1,195 @@
-from sqlalchemy.orm import sessionmaker
+import random
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 import os
 
+
+def env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return default if value in (None, "") else int(value)
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    return default if value in (None, "") else value.lower() in ("1", "true", "yes")
+
+
+def sqlite_tuned(url) -> bool:
+    # in-memory databases are per connection, so they keep the default pool
+    return (
+        url.get_backend_name() == "sqlite"
+        and url.database not in (None, "", ":memory:")
+        and env_bool("DB_SQLITE_TUNED", False)
+    )
+
+
+def sqlite_pragmas(readonly: bool):
+    pragmas = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": env_int("DB_SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+        # negative values are KiB
+        "cache_size": env_int("DB_SQLITE_CACHE_SIZE", -64000),
+        "busy_timeout": env_int("DB_SQLITE_BUSY_TIMEOUT", 5000),
+    }
+    if readonly:
+        pragmas["query_only"] = "ON"
+    return pragmas
+
+
+def tune_sqlite_engine(db_engine, readonly: bool = False):
+    pragmas = sqlite_pragmas(readonly)
+
+    @event.listens_for(db_engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+        if not readonly:
+            # BEGIN ourselves, see begin_immediate
+            dbapi_connection.isolation_level = None
+
+    if not readonly:
+
+        @event.listens_for(db_engine.sync_engine, "begin")
+        def begin_immediate(connection):
+            # take the write lock up front: a deferred transaction that reads
+            # first fails with "database is locked" instead of waiting for
+            # busy_timeout when another process is writing
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return db_engine
+
+
+def create_engine_from_env(url: str, readonly: bool = False):
+    url = make_url(url)
+    options = {"pool_pre_ping": env_bool("DB_POOL_PRE_PING", False)}
+    if sqlite_tuned(url):
+        # one writer connection queues every write of this process
+        options.update(
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=env_int("DB_SQLITE_READ_POOL_SIZE", 4) if readonly else 1,
+            max_overflow=0,
+            pool_timeout=env_int("DB_POOL_TIMEOUT", 30),
+        )
+    elif url.get_backend_name() != "sqlite":
+        options.update(
+            pool_size=env_int("DB_POOL_SIZE", 5),
+            max_overflow=env_int("DB_MAX_OVERFLOW", 10),
+            pool_timeout=env_int("DB_POOL_TIMEOUT", 30),
+            pool_recycle=env_int("DB_POOL_RECYCLE", -1),
+        )
+    if url.get_driver_name() == "asyncpg":
+        # set DB_STATEMENT_CACHE_SIZE=0 behind pgbouncer in transaction mode
+        statement_cache_size = env_int("DB_STATEMENT_CACHE_SIZE", 100)
+        url = url.update_query_dict(
+            {"prepared_statement_cache_size": str(statement_cache_size)}
+        )
+        server_settings = {
+            "application_name": os.getenv("DB_APPLICATION_NAME", "fastapi-crud")
+        }
+        if os.getenv("DB_STATEMENT_TIMEOUT"):
+            server_settings["statement_timeout"] = os.getenv("DB_STATEMENT_TIMEOUT")
+        options["connect_args"] = {
+            "statement_cache_size": statement_cache_size,
+            "server_settings": server_settings,
+        }
+    db_engine = create_async_engine(url, **options)
+    if sqlite_tuned(url):
+        tune_sqlite_engine(db_engine, readonly=readonly)
+    return db_engine
+
+
+def read_engine(db_engine, snapshot: bool = False):
+    # both variants share the pool of db_engine
+    if not snapshot:
+        # no BEGIN/COMMIT round trips, each statement sees the latest data
+        return db_engine.execution_options(isolation_level="AUTOCOMMIT")
+    if db_engine.dialect.name == "postgresql":
+        return db_engine.execution_options(postgresql_readonly=True)
+    return db_engine
+
+
+def pool_stats(engine):
+    pool = engine.sync_engine.pool
+    stats = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    return stats
+
+
 # MAIN DATABASE CONFIGURATION
 
 MAIN_DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_async_engine(MAIN_DATABASE_URL)
-SessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+engine = create_engine_from_env(MAIN_DATABASE_URL)
+replica_engines = [
+    create_engine_from_env(url)
+    for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+# replicas may lag behind the primary; the SQLite read pool reads the same file
+replicas_lag = bool(replica_engines)
+if sqlite_tuned(make_url(MAIN_DATABASE_URL)) and not replica_engines:
+    # reads get their own pool of query_only connections next to the writer
+    replica_engines = [create_engine_from_env(MAIN_DATABASE_URL, readonly=True)]
+read_engines = [read_engine(db_engine) for db_engine in replica_engines or [engine]]
+snapshot_engines = [
+    read_engine(db_engine, snapshot=True) for db_engine in replica_engines or [engine]
+]
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self.info.get("replica")
+        if replica is not None and not self._flushing:
+            return replica.sync_engine
+        return engine.sync_engine
+
+
+SessionLocal = sessionmaker(
+    class_=AsyncSession, sync_session_class=RoutingSession, expire_on_commit=False
+)
 Base = declarative_base()
 
 
+def reads_replica(db: AsyncSession) -> bool:
+    return replicas_lag and db.sync_session.info.get("replica") is not None
+
+
+def sibling_session(db: AsyncSession) -> AsyncSession:
+    # same engine and routing as db, for work that may outlive db's request
+    session = AsyncSession(
+        sync_session_class=type(db.sync_session), expire_on_commit=False
+    )
+    # SessionLocal sessions have no bind of their own; RoutingSession picks one
+    session.sync_session.bind = db.sync_session.bind
+    session.sync_session.info.update(db.sync_session.info)
+    return session
+
+
 async def get_db():
+    # the session checks out a connection on its first query only
+    async with SessionLocal() as db:
+        yield db
+        # write helpers commit themselves, this only flushes leftover ORM changes
+        if db.new or db.dirty or db.deleted:
+            await db.commit()
+
+
+async def get_read_db():
+    async with SessionLocal() as db:
+        db.sync_session.info["replica"] = random.choice(read_engines)
+        yield db
+
+
+async def get_snapshot_db():
+    # one read-only transaction for multi-statement reads such as exports
     async with SessionLocal() as db:
+        db.sync_session.info["replica"] = random.choice(snapshot_engines)
         yield db
-        await db.commit()
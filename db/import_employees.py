@@ -0,0 +1,62 @@
+"""Load employees from a CSV or NDJSON file, upserting on phone_number.
+
+    DATABASE_URL=postgresql+asyncpg://... python -m db.import_employees employees.csv
+
+Files written by GET /employees/export can be loaded as is. Postgres loads
+each chunk with COPY into a staging table and merges it; other databases
+fall back to batched executemany.
+"""
+import argparse
+import asyncio
+import sys
+
+from api.utils.imports import IMPORT_CHUNK_SIZE, import_employees
+from db.config import SessionLocal, engine
+from schemas.employee import ExportFormat
+
+
+async def read_lines(path: str):
+    with open(path, encoding="utf-8", newline="") as file:
+        for line in file:
+            yield line.rstrip("\n")
+
+
+async def print_progress(report):
+    print(
+        f"{report['processed']:>12,} rows  {report['imported']:>12,} imported"
+        f"  {report['failed']:>8,} failed  {report['rows_per_second']:>10,.0f} rows/sec",
+        file=sys.stderr,
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument(
+        "--format", choices=[format.value for format in ExportFormat], default=None
+    )
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    async with SessionLocal() as db:
+        result = await import_employees(
+            db=db,
+            lines=read_lines(args.path),
+            format=ExportFormat(format),
+            chunk_size=args.chunk_size,
+            progress=print_progress,
+        )
+    await engine.dispose()
+    for error in result.errors:
+        print(f"line {error.line}: {error.detail}")
+    print(
+        f"imported {result.imported:,} of {result.processed:,} rows"
+        f" in {result.elapsed:.1f}s ({result.rows_per_second:,.0f} rows/sec)"
+    )
+    if result.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
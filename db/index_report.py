@@ -0,0 +1,84 @@
+"""Report unused or redundant single-column indexes declared on Employee.
+
+    DATABASE_URL=postgresql+asyncpg://... python -m db.index_report --strict
+
+Redundancy is derived from the model. Usage comes from pg_stat_user_indexes,
+so it only covers Postgres and the time since statistics were last reset.
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from db.models.employee import Employee
+
+UNUSED_INDEXES = text(
+    "SELECT indexrelname, idx_scan, pg_relation_size(indexrelid) AS size "
+    "FROM pg_stat_user_indexes WHERE relname = :table AND idx_scan = 0"
+)
+
+
+def single_column_indexes(table):
+    return [index for index in table.indexes if len(index.columns) == 1]
+
+
+def redundant_indexes(table):
+    primary_key = [column.name for column in table.primary_key.columns]
+    indexes = sorted(table.indexes, key=lambda index: index.name)
+    redundant = []
+    for index in single_column_indexes(table):
+        column = next(iter(index.columns)).name
+        if primary_key[:1] == [column]:
+            redundant.append((index.name, "covered by the primary key"))
+            continue
+        if index.unique:
+            # still enforces a constraint
+            continue
+        for other in indexes:
+            leading = [other_column.name for other_column in other.columns][:1]
+            if other is not index and len(other.columns) > 1 and leading == [column]:
+                redundant.append((index.name, f"prefix of {other.name}"))
+                break
+    return redundant
+
+
+async def unused_indexes(url: str, table):
+    declared = {index.name for index in single_column_indexes(table)}
+    engine = create_async_engine(url)
+    try:
+        async with engine.connect() as conn:
+            if conn.dialect.name != "postgresql":
+                return None
+            rows = (await conn.execute(UNUSED_INDEXES, {"table": table.name})).all()
+    finally:
+        await engine.dispose()
+    return [row for row in rows if row.indexrelname in declared]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument(
+        "--strict", action="store_true", help="exit with 1 if anything is reported"
+    )
+    args = parser.parse_args()
+
+    table = Employee.__table__
+    redundant = redundant_indexes(table)
+    for name, reason in redundant:
+        print(f"redundant {name}: {reason}")
+    unused = await unused_indexes(args.url, table) if args.url else None
+    if unused is None:
+        print("index usage statistics need a PostgreSQL DATABASE_URL")
+    else:
+        for row in unused:
+            print(f"unused    {row.indexrelname}: 0 scans, {row.size:,} bytes")
+    if args.strict and (redundant or unused):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
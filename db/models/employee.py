@@ -1,7 +1,8 @@
 import enum
 from sqlalchemy.orm import validates
-from sqlalchemy import Column, Integer, String, Enum
-from fastapi import HTTPException
+from datetime import datetime
+from typing import Iterable, List, Optional
+from sqlalchemy import Column, DateTime, Index, Integer, String, Enum, DDL, event
 from ..config import Base
 from .mixins import Timestamp
 
@@ -13,30 +14,77 @@ class Role(enum.IntEnum):
     manager = 4
 
 
+# built once: these checks run per row on every single and bulk write
+ROLES = frozenset(role.value for role in Role)
+INVALID_ROLE = f"Invalid role! Available roles: {sorted(ROLES)}"
+INVALID_PHONE_NUMBER = "Phone number must contain '+' "
+
+
+class EmployeeValidationError(ValueError):
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+def employee_errors(rows: Iterable[dict]) -> List[Optional[str]]:
+    roles = ROLES
+    return [
+        INVALID_ROLE
+        if "role" in row and row["role"] not in roles
+        else INVALID_PHONE_NUMBER
+        if row.get("phone_number") is not None and "+" not in row["phone_number"]
+        else None
+        for row in rows
+    ]
+
+
+def employee_data_error(data: dict) -> Optional[str]:
+    return employee_errors((data,))[0]
+
+
 class Employee(Timestamp, Base):
     __tablename__ = "employees"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     name = Column(String(100), index=True, nullable=False)
     phone_number = Column(String(25), unique=True, index=True, nullable=False)
     age = Column(Integer, index=True, nullable=False)
     salary = Column(Integer, index=True, nullable=False)
     role = Column(Enum(Role))
 
-    @validates("phone_number")
-    def validate_phone_number(self, key, value):
-        if "+" not in value:
-            raise HTTPException(
-                status_code=400, detail="Phone number must contain '+' "
-            )
-        return value
+    __table_args__ = (
+        # role filters with salary ranges/sorts, and the change feed keyset
+        Index("ix_employees_role_salary", "role", "salary"),
+        Index("ix_employees_updated_at_id", "updated_at", "id"),
+    )
 
-    @validates("role")
-    def validate_role(self, key, value):
-        available_roles = [role.value for role in Role]
-        if value not in available_roles:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid role! Available roles: {available_roles}",
-            )
+    @validates("phone_number", "role")
+    def validate_field(self, key, value):
+        error = employee_data_error({key: value})
+        if error:
+            raise EmployeeValidationError(error)
         return value
+
+
+class EmployeeTombstone(Base):
+    __tablename__ = "employee_tombstones"
+
+    id = Column(Integer, primary_key=True)
+    employee_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+# trigram index for name search; Postgres only, SQLite falls back to LIKE
+event.listen(
+    Employee.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+event.listen(
+    Employee.__table__,
+    "after_create",
+    DDL(
+        "CREATE INDEX IF NOT EXISTS ix_employees_name_trgm "
+        "ON employees USING gin (name gin_trgm_ops)"
+    ).execute_if(dialect="postgresql"),
+)
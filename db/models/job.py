@@ -0,0 +1,23 @@
+from sqlalchemy import Column, DateTime, Integer, JSON, String, Text
+from ..config import Base
+from .mixins import Timestamp
+
+
+class Job(Timestamp, Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)
+    # queued -> running -> succeeded | failed
+    status = Column(String(20), index=True, nullable=False, default="queued")
+    params = Column(JSON, nullable=False)
+    result = Column(JSON)
+    error = Column(Text)
+    processed = Column(Integer, nullable=False, default=0)
+    total = Column(Integer)
+    # where the handler resumes after a restart, committed with each chunk
+    checkpoint = Column(JSON)
+    # refreshed while a worker runs the job; a stale one means the worker died
+    heartbeat_at = Column(DateTime)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
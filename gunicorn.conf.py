@@ -0,0 +1,36 @@
+"""Production server profile: gunicorn managing uvicorn workers.
+
+    alembic upgrade head && gunicorn main:app
+
+uvicorn picks uvloop and httptools automatically when they are installed.
+"""
+import multiprocessing
+import os
+import time
+
+from api.utils.instrumentation import resident_memory_bytes
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+# every worker opens up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+keepalive = int(os.getenv("KEEPALIVE", 5))
+timeout = int(os.getenv("WORKER_TIMEOUT", 60))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+max_requests = int(os.getenv("MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", 0))
+accesslog = os.getenv("ACCESS_LOG") or None
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.monotonic()
+
+
+def post_worker_init(worker):
+    worker.log.info(
+        "worker %d imported the app in %.2fs, rss %.1f MiB",
+        worker.pid,
+        time.monotonic() - worker.forked_at,
+        resident_memory_bytes() / 2**20,
+    )
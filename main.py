@@ -1,30 +1,56 @@
-from fastapi import FastAPI
-from api import employees
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from db.config import engine, Base
-import os
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from api import employees, jobs, metrics
+from db.config import engine, replica_engines, env_bool, Base
+from db.models.employee import EmployeeValidationError
+from api.utils.admission import AdmissionMiddleware
+from api.utils.compression import CompressionMiddleware
+from api.utils.jobs import job_runner
+from api.utils.instrumentation import (
+    InstrumentationMiddleware,
+    instrument_engine,
+    process_stats,
+)
 
 
 app = FastAPI(title="FastAPI little CRUD")
 
 app.include_router(employees.router)
+app.include_router(jobs.router)
+app.include_router(metrics.router)
+# instrumentation wraps admission control so rejections show up in /metrics
+app.add_middleware(AdmissionMiddleware, routes=app.routes)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(InstrumentationMiddleware)
+
+for db_engine in [engine, *replica_engines]:
+    instrument_engine(db_engine)
+
+
+@app.exception_handler(EmployeeValidationError)
+async def employee_validation_error(request: Request, error: EmployeeValidationError):
+    return JSONResponse(status_code=400, content={"detail": error.detail})
 
 
 @app.on_event("startup")
 async def init_tables():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # production schemas come from `alembic upgrade head`, run once per deploy
+    if env_bool("DB_CREATE_ALL", False):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
 
 
-# TEST DATABASE CONFIGURATION
+@app.on_event("startup")
+async def record_startup():
+    process_stats.ready()
+
 
-TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
-test_engine = create_async_engine(TEST_DATABASE_URL)
-SessionLocal = sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
+@app.on_event("startup")
+async def start_job_runner():
+    # picks up jobs left queued by a previous deploy
+    job_runner.start()
 
 
-async def override_get_db():
-    async with SessionLocal() as db:
-        yield db
-        await db.commit()
+@app.on_event("shutdown")
+async def stop_job_runner():
+    await job_runner.stop()
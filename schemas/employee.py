@@ -1,6 +1,8 @@
+import enum
 from datetime import datetime
-from typing import Optional
-from pydantic import BaseModel
+from typing import List, Optional, Union
+from pydantic import BaseModel, StrictInt, StrictStr, conlist, root_validator
+from db.models.employee import Role
 
 
 class EmployeeBase(BaseModel):
@@ -30,3 +32,119 @@ class Employee(EmployeeBase):
 
     class Config:
         orm_mode = True
+
+
+class EmployeeProjection(EmployeeUpdate):
+    # GET /employees?fields= returns only the requested keys of Employee
+    id: Optional[int]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+
+class EmployeeBulkResult(BaseModel):
+    index: int
+    status: str
+    id: Optional[int]
+    detail: Optional[str]
+
+
+class ExportFormat(str, enum.Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+class EmployeeFilter(BaseModel):
+    role: Optional[Role]
+    min_age: Optional[int]
+    max_age: Optional[int]
+    min_salary: Optional[int]
+    max_salary: Optional[int]
+    name_prefix: Optional[str]
+    search: Optional[str]
+
+
+class StatsGroup(str, enum.Enum):
+    role = "role"
+    age_band = "age_band"
+
+
+class EmployeeStats(BaseModel):
+    group: str
+    count: int
+    avg_salary: float
+    min_salary: int
+    max_salary: int
+    p50_salary: int
+    p90_salary: int
+    p99_salary: int
+
+
+class EmployeeSelection(BaseModel):
+    ids: Optional[conlist(int, min_items=1, max_items=10000)]
+    filter: Optional[EmployeeFilter]
+
+    @root_validator(skip_on_failure=True)
+    def check_selection(cls, values):
+        ids, employee_filter = values.get("ids"), values.get("filter")
+        if (ids is None) == (employee_filter is None):
+            raise ValueError("Either ids or filter must be given")
+        if employee_filter is not None and not employee_filter.dict(exclude_none=True):
+            raise ValueError("Filter must not be empty")
+        return values
+
+
+class EmployeeBulkUpdate(EmployeeSelection):
+    changes: EmployeeUpdate
+
+    @root_validator(skip_on_failure=True)
+    def check_changes(cls, values):
+        if values["changes"].phone_number is not None:
+            raise ValueError("Phone number can not be changed in bulk")
+        return values
+
+
+class EmployeeBulkWriteResult(BaseModel):
+    affected: int
+
+
+class EmployeeChange(BaseModel):
+    type: str
+    id: int
+    employee: Optional[Employee]
+    deleted_at: Optional[datetime]
+
+
+class EmployeeChanges(BaseModel):
+    changes: List[EmployeeChange]
+    next_token: str
+    has_more: bool
+
+
+class EmployeeBatchGet(BaseModel):
+    ids: Optional[conlist(int, min_items=1, max_items=5000)]
+    phone_numbers: Optional[conlist(str, min_items=1, max_items=5000)]
+
+    @root_validator(skip_on_failure=True)
+    def check_keys(cls, values):
+        if (values.get("ids") is None) == (values.get("phone_numbers") is None):
+            raise ValueError("Either ids or phone_numbers must be given")
+        return values
+
+
+class EmployeeBatch(BaseModel):
+    employees: List[Employee]
+    missing: List[Union[StrictInt, StrictStr]]
+
+
+class EmployeeImportError(BaseModel):
+    line: int
+    detail: str
+
+
+class EmployeeImportResult(BaseModel):
+    processed: int
+    imported: int
+    failed: int
+    errors: List[EmployeeImportError]
+    elapsed: float
+    rows_per_second: float
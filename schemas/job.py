@@ -0,0 +1,38 @@
+import enum
+from datetime import datetime
+from typing import Any, Optional
+from pydantic import BaseModel, confloat
+from db.models.employee import Role
+
+
+class JobStatus(str, enum.Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    status: JobStatus
+    processed: int
+    total: Optional[int]
+    error: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+    class Config:
+        orm_mode = True
+
+
+class JobResult(BaseModel):
+    id: int
+    status: JobStatus
+    result: Any
+
+
+class SalaryAdjustment(BaseModel):
+    role: Role
+    percent: confloat(gt=-100, le=1000)
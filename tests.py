@@ -1,12 +1,86 @@
+import asyncio
+import base64
+import csv
+import io
+import json
+import os
 import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import Index, MetaData, event, func, select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
 from httpx import AsyncClient
-from main import app, test_engine, override_get_db
-from db.config import Base, get_db
+from main import app
+from db.config import (
+    Base,
+    get_db,
+    get_read_db,
+    get_snapshot_db,
+    engine,
+    RoutingSession,
+    SessionLocal,
+    create_engine_from_env,
+    pool_stats,
+    read_engine,
+)
+from api.utils.cache import cache, LRUCache, RedisCache
+from api.utils.employees import employee_cache_key, employee_flight, page_flight
+from api.utils.employees import bulk_patch_employees, cache_employee, get_employee
+from api.utils.employees import batch_get_employees, get_cached_employee
+from schemas.employee import EmployeeBatchGet, EmployeeBulkUpdate, ExportFormat
+from api.utils.imports import import_employees
+from db import config as db_config
+from api.utils.instrumentation import instrument_engine
+from db.models.employee import Employee, EmployeeValidationError, employee_errors
+from db.index_report import redundant_indexes
+from api.utils import changes
+from api.utils import employees as employees_utils
+from api.utils.jobs import claim_job, job_runner
+from db.models.job import Job
+from api.utils.compression import negotiate_encoding
+from api.utils.admission import (
+    admission_control,
+    ConcurrencyLimiter,
+    MemoryRateLimiter,
+    RateLimit,
+    RedisRateLimiter,
+)
+
+# TEST DATABASE CONFIGURATION
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+test_engine = create_async_engine(TEST_DATABASE_URL)
+TestSessionLocal = sessionmaker(
+    test_engine, class_=AsyncSession, expire_on_commit=False
+)
+instrument_engine(test_engine)
+
+
+async def override_get_db():
+    async with TestSessionLocal() as db:
+        yield db
+        if db.new or db.dirty or db.deleted:
+            await db.commit()
+
+
+async def override_get_read_db():
+    # production session class and routing, with the test database as replica
+    async with SessionLocal() as db:
+        db.sync_session.info["replica"] = read_engine(test_engine)
+        yield db
+
+
+async def override_get_snapshot_db():
+    async with SessionLocal() as db:
+        db.sync_session.info["replica"] = read_engine(test_engine, snapshot=True)
+        yield db
 
 
 @pytest.mark.asyncio
 async def test_create_tables():
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_read_db
+    app.dependency_overrides[get_snapshot_db] = override_get_snapshot_db
 
     async with test_engine.begin() as conn:  # create tables as first test
         await conn.run_sync(Base.metadata.create_all)
@@ -277,6 +351,1216 @@ async def test_try_to_create_invalid_role():
         }
 
 
+@pytest.mark.asyncio
+async def test_cursor_pagination():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/employees?limit=1")
+        assert response.status_code == 200, response.text
+        assert [e["id"] for e in response.json()] == [1]
+        cursor = response.headers["X-Next-Cursor"]
+
+        response = await ac.get(f"/employees?limit=1&cursor={cursor}")
+        assert response.status_code == 200, response.text
+        assert [e["id"] for e in response.json()] == [2]
+        cursor = response.headers["X-Next-Cursor"]
+
+        response = await ac.get(f"/employees?limit=1&cursor={cursor}")
+        assert response.status_code == 200, response.text
+        assert response.json() == []
+        assert "X-Next-Cursor" not in response.headers
+
+        response = await ac.get("/employees?limit=1&sort=-salary")
+        assert response.status_code == 200, response.text
+        assert [e["salary"] for e in response.json()] == [350000]
+        cursor = response.headers["X-Next-Cursor"]
+
+        response = await ac.get(f"/employees?limit=1&sort=-salary&cursor={cursor}")
+        assert response.status_code == 200, response.text
+        assert [e["salary"] for e in response.json()] == [150000]
+
+        response = await ac.get(f"/employees?sort=age&cursor={cursor}")
+        assert response.status_code == 400, response.text
+
+        response = await ac.get("/employees?cursor=not-a-cursor")
+        assert response.status_code == 400, response.text
+
+        for sort, values in [
+            ("id", [{"a": 1}]),
+            ("id", "x"),
+            ("id", [True]),
+            ("name", [None, None]),
+            ("name", [1, 2]),
+            ("-salary", ["350000", 1]),
+        ]:
+            payload = json.dumps({"s": sort, "v": values}).encode()
+            cursor = base64.urlsafe_b64encode(payload).decode()
+            response = await ac.get(
+                "/employees", params={"sort": sort, "cursor": cursor}
+            )
+            assert response.status_code == 400, response.text
+
+        response = await ac.get("/employees?sort=created_at")
+        assert response.status_code == 400, response.text
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_employees():
+    mihail = {
+        "name": "Mihail",
+        "age": 29,
+        "role": 2,
+        "salary": 150000,
+        "phone_number": "+79515555555",
+    }
+    ivan = {
+        "name": "Ivan",
+        "age": 41,
+        "role": 4,
+        "salary": 400000,
+        "phone_number": "+79990000001",
+    }
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post(
+            "/employees/bulk",
+            json=[
+                dict(ivan, salary=1),
+                mihail,
+                dict(ivan, role=0, phone_number="+79990000002"),
+                dict(ivan, phone_number="79990000003"),
+                ivan,
+            ],
+        )
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert [row["status"] for row in data] == [
+            "error",
+            "updated",
+            "error",
+            "error",
+            "created",
+        ]
+        assert data[1]["id"] == 2
+        assert data[2]["detail"] == "Invalid role! Available roles: [1, 2, 3, 4]"
+        assert data[3]["detail"] == "Phone number must contain '+' "
+        ivan_id = data[4]["id"]
+
+        response = await ac.get(f"/employees/{ivan_id}")
+        assert response.status_code == 200, response.text
+        assert response.json()["salary"] == 400000
+
+        response = await ac.post(
+            "/employees/bulk?update_existing=false", json=[dict(ivan, salary=1)]
+        )
+        assert response.status_code == 200, response.text
+        assert response.json() == [
+            {"index": 0, "status": "unchanged", "id": ivan_id, "detail": None}
+        ]
+
+        response = await ac.get(f"/employees/{ivan_id}")
+        assert response.json()["salary"] == 400000
+
+        response = await ac.delete(f"/employees/{ivan_id}")
+        assert response.status_code == 200, response.text
+
+
+@pytest.mark.asyncio
+async def test_export_employees():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/employees/export")
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["id"] for row in rows] == [1, 2]
+        assert rows[1]["phone_number"] == "+79515555555"
+        assert rows[1]["role"] == 2
+
+        response = await ac.get("/employees/export?format=csv")
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"].startswith("text/csv")
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [row["id"] for row in rows] == ["1", "2"]
+        assert rows[0]["phone_number"] == "+9999999999"
+
+        response = await ac.get("/employees/export?format=xml")
+        assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_read_employee_cache():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        await cache.delete(employee_cache_key(1))
+        hits = cache.hits
+        response = await ac.get("/employees/1")
+        assert response.status_code == 200, response.text
+        response = await ac.get("/employees/1")
+        assert response.status_code == 200, response.text
+        assert cache.hits == hits + 1
+
+        response = await ac.patch("/employees/1", json={"salary": 360000})
+        assert response.status_code == 200, response.text
+        response = await ac.get("/employees/1")
+        assert response.json()["salary"] == 360000
+
+        response = await ac.patch("/employees/1", json={"salary": 350000})
+        assert response.status_code == 200, response.text
+        response = await ac.get("/employees/1")
+        assert response.json()["salary"] == 350000
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.scripts = []
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value.encode()
+
+    async def eval(self, script, numkeys, *args):
+        # SET_VERSIONED_SCRIPT, step by step
+        self.scripts.append((numkeys, *args))
+        keys, (ttl, *values) = args[:numkeys], args[numkeys:]
+        for i in range(0, numkeys, 2):
+            value, version = values[i], int(values[i + 1])
+            current = self.data.get(keys[i + 1])
+            if current is None or int(current) <= version:
+                if value == "":
+                    await self.delete(keys[i])
+                else:
+                    await self.set(keys[i], value, ex=ttl)
+                await self.set(keys[i + 1], str(version), ex=ttl)
+        return 0
+
+    async def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def set(self, key, value, ex=None):
+        self.commands.append((key, value))
+
+    async def execute(self):
+        for key, value in self.commands:
+            await self.client.set(key, value, ex=None)
+
+
+@pytest.mark.asyncio
+async def test_cache_backends():
+    lru = LRUCache(maxsize=2, ttl=60)
+    await lru.set("a", "1")
+    await lru.set("b", "2")
+    assert await lru.get("a") == "1"
+    await lru.set("c", "3")
+    assert await lru.get("b") is None
+    assert await lru.get("c") == "3"
+    assert lru.stats() == {"backend": "memory", "hits": 2, "misses": 1, "size": 2}
+
+    expired = LRUCache(ttl=0)
+    await expired.set("a", "1")
+    assert await expired.get("a") is None
+
+    for versioned in (LRUCache(), RedisCache(FakeRedis())):
+        await versioned.set_versioned({"a": ("new", 2)})
+        await versioned.set_versioned({"a": ("old", 1)})
+        assert await versioned.get("a") == "new"
+        await versioned.set_versioned({"a": (None, 3)})
+        await versioned.set_versioned({"a": ("old", 2)})
+        assert await versioned.get("a") is None
+        await versioned.set_versioned({"a": ("newer", 3)})
+        assert await versioned.get("a") == "newer"
+
+    redis = RedisCache(FakeRedis())
+    await redis.set("a", "1")
+    assert await redis.get("a") == "1"
+    assert "fastapi-crud:a" in redis.client.data
+    await redis.delete("a")
+    assert await redis.get("a") is None
+    assert redis.stats() == {"backend": "redis", "hits": 1, "misses": 1}
+    await redis.set_many({"a": "1", "b": "2"})
+    assert await redis.get_many(["b", "c", "a"]) == ["2", None, "1"]
+    await redis.set_versioned({"a": ("1", 5), "b": (None, 6)})
+    assert redis.client.scripts == [
+        (
+            4,
+            "fastapi-crud:a",
+            "fastapi-crud:version:a",
+            "fastapi-crud:b",
+            "fastapi-crud:version:b",
+            60,
+            "1",
+            5,
+            "",
+            6,
+        )
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["memory", "redis"])
+async def test_cache_keeps_newer_rows(backend):
+    if backend == "redis":
+        employees_utils.cache = RedisCache(FakeRedis())
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            # a cache miss that read the row before a write finishes after it
+            async with TestSessionLocal() as db:
+                stale = await get_employee(db=db, employee_id=1)
+            await ac.patch("/employees/1", json={"salary": 999})
+            await cache_employee(stale)
+            assert (await ac.get("/employees/1")).json()["salary"] == 999
+
+            # bulk writes only drop the entry, but keep its version
+            async with TestSessionLocal() as db:
+                stale = await get_employee(db=db, employee_id=1)
+            response = await ac.patch(
+                "/employees", json={"ids": [1], "changes": {"salary": 350000}}
+            )
+            assert response.status_code == 200, response.text
+            await cache_employee(stale)
+            assert (await ac.get("/employees/1")).json()["salary"] == 350000
+    finally:
+        employees_utils.cache = cache
+
+
+@pytest.mark.asyncio
+async def test_write_missing_employee():
+    employee = {
+        "name": "Alexey",
+        "age": 36,
+        "role": 3,
+        "salary": 350000,
+        "phone_number": "+78005553500",
+    }
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.put("/employees/999", json=employee)
+        assert response.status_code == 404, response.text
+        response = await ac.patch("/employees/999", json={"age": 40})
+        assert response.status_code == 404, response.text
+        response = await ac.delete("/employees/999")
+        assert response.status_code == 404, response.text
+
+        response = await ac.patch("/employees/1", json={"phone_number": "+9999999999"})
+        assert response.status_code == 200, response.text
+        assert response.json()["phone_number"] == "+9999999999"
+
+
+@pytest.mark.asyncio
+async def test_metrics():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/metrics/pool")
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["primary"] == pool_stats(engine)
+        assert data["primary"].get("checkedout", 0) == 0
+        assert data["replicas"] == []
+
+        # DATABASE_URL may be SQLite with a NullPool; check queue stats separately
+        queue_engine = create_engine_from_env("postgresql+asyncpg://u:p@localhost/db")
+        stats = pool_stats(queue_engine)
+        assert stats["pool"] == "AsyncAdaptedQueuePool"
+        assert stats["checkedout"] == 0
+        await queue_engine.dispose()
+
+        response = await ac.get("/metrics/cache")
+        assert response.status_code == 200, response.text
+        assert response.json()["hits"] == cache.hits
+
+        response = await ac.get("/metrics/process")
+        assert response.json()["pid"] == os.getpid()
+        assert response.json()["resident_memory_bytes"] > 0
+
+
+def test_routing_session():
+    session = RoutingSession()
+    assert session.get_bind() is engine.sync_engine
+    session.info["replica"] = test_engine
+    assert session.get_bind() is test_engine.sync_engine
+
+
+@pytest.mark.asyncio
+async def test_filter_and_sort_employees():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/employees?role=2")
+        assert response.status_code == 200, response.text
+        assert [e["id"] for e in response.json()] == [2]
+
+        response = await ac.get("/employees?min_age=30&max_salary=400000")
+        assert [e["id"] for e in response.json()] == [1]
+
+        response = await ac.get("/employees?min_salary=100000&max_age=20")
+        assert response.json() == []
+
+        response = await ac.get("/employees?name_prefix=Mih")
+        assert [e["id"] for e in response.json()] == [2]
+
+        response = await ac.get("/employees?name_prefix=%25")
+        assert response.json() == []
+
+        response = await ac.get("/employees?search=lex")
+        assert [e["id"] for e in response.json()] == [1]
+
+        response = await ac.get("/employees?sort=-age,name")
+        assert [e["id"] for e in response.json()] == [1, 2]
+
+        response = await ac.get("/employees?sort=role,name")
+        assert response.status_code == 400, response.text
+
+        response = await ac.get("/employees?sort=age,age")
+        assert response.status_code == 400, response.text
+
+        response = await ac.get("/employees?role=0")
+        assert response.status_code == 422, response.text
+
+
+@pytest.mark.asyncio
+async def test_employee_stats():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/employees/stats")
+        assert response.status_code == 200, response.text
+        assert response.json() == [
+            {
+                "group": "developer",
+                "count": 1,
+                "avg_salary": 350000.0,
+                "min_salary": 350000,
+                "max_salary": 350000,
+                "p50_salary": 350000,
+                "p90_salary": 350000,
+                "p99_salary": 350000,
+            },
+            {
+                "group": "lead",
+                "count": 1,
+                "avg_salary": 150000.0,
+                "min_salary": 150000,
+                "max_salary": 150000,
+                "p50_salary": 150000,
+                "p90_salary": 150000,
+                "p99_salary": 150000,
+            },
+        ]
+
+        response = await ac.get("/employees/stats?group_by=age_band&band_width=100")
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert len(data) == 1
+        assert data[0]["group"] == "0-99"
+        assert data[0]["count"] == 2
+        assert data[0]["avg_salary"] == 250000
+        assert data[0]["p50_salary"] == 150000
+        assert data[0]["p99_salary"] == 350000
+
+        response = await ac.patch("/employees/2", json={"role": 1})
+        assert response.status_code == 200, response.text
+        response = await ac.get("/employees/stats")
+        assert [(row["group"], row["count"]) for row in response.json()] == [
+            ("developer", 2)
+        ]
+        response = await ac.patch("/employees/2", json={"role": 2})
+        assert response.status_code == 200, response.text
+
+        response = await ac.get("/employees/stats?band_width=0")
+        assert response.status_code == 422, response.text
+
+
+@pytest.mark.asyncio
+async def test_list_matches_single_employee():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/employees")
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"] == "application/json"
+        employees = response.json()
+        for employee in employees:
+            response = await ac.get(f"/employees/{employee['id']}")
+            assert response.json() == employee
+
+
+@pytest.mark.asyncio
+async def test_request_instrumentation():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/employees/2")
+        assert response.status_code == 200, response.text
+        assert response.headers["Server-Timing"].startswith("app;dur=")
+
+        await cache.delete(employee_cache_key(2))
+        response = await ac.get("/employees/2")
+        assert 'desc="1 queries"' in response.headers["Server-Timing"]
+
+        response = await ac.get("/metrics")
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"].startswith("text/plain")
+        lines = response.text.splitlines()
+        assert (
+            'http_requests_total{method="GET",route="/employees/{employee_id}",'
+            'status="200"}' in " ".join(lines)
+        )
+        assert any(
+            line.startswith(
+                'db_queries_total{method="GET",route="/employees/{employee_id}"}'
+            )
+            for line in lines
+        )
+        assert 'cache_lookups_total{backend="memory",result="hit"}' in response.text
+
+        response = await ac.get("/metrics/slow-queries")
+        assert response.status_code == 200, response.text
+
+
+@pytest.mark.asyncio
+async def test_bulk_patch_and_delete_employees():
+    temporary = [
+        {
+            "name": f"Temporary {i}",
+            "age": 50 + i,
+            "role": 3,
+            "salary": 100000,
+            "phone_number": f"+7000000000{i}",
+        }
+        for i in range(3)
+    ]
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/employees/bulk", json=temporary)
+        assert response.status_code == 200, response.text
+        ids = [row["id"] for row in response.json()]
+
+        response = await ac.patch(
+            "/employees", json={"ids": ids[:2], "changes": {"salary": 120000}}
+        )
+        assert response.status_code == 200, response.text
+        assert response.json() == {"affected": 2}
+
+        response = await ac.patch(
+            "/employees",
+            json={
+                "filter": {"name_prefix": "Temporary", "min_age": 51},
+                "changes": {"role": 4},
+            },
+        )
+        assert response.json() == {"affected": 2}
+
+        response = await ac.get("/employees?name_prefix=Temporary")
+        assert [(e["salary"], e["role"]) for e in response.json()] == [
+            (120000, 3),
+            (120000, 4),
+            (100000, 4),
+        ]
+
+        response = await ac.patch(
+            "/employees", json={"ids": ids, "changes": {"role": 0}}
+        )
+        assert response.status_code == 400, response.text
+        response = await ac.patch(
+            "/employees", json={"ids": ids, "changes": {"phone_number": "+7"}}
+        )
+        assert response.status_code == 422, response.text
+        response = await ac.request(
+            "DELETE", "/employees", json={"ids": ids, "filter": {"role": 3}}
+        )
+        assert response.status_code == 422, response.text
+        response = await ac.request("DELETE", "/employees", json={"filter": {}})
+        assert response.status_code == 422, response.text
+
+        response = await ac.request(
+            "DELETE", "/employees", json={"filter": {"name_prefix": "Temporary"}}
+        )
+        assert response.status_code == 200, response.text
+        assert response.json() == {"affected": 3}
+        response = await ac.get(f"/employees/{ids[0]}")
+        assert response.status_code == 404, response.text
+
+        response = await ac.request("DELETE", "/employees", json={"ids": ids})
+        assert response.json() == {"affected": 0}
+
+        response = await ac.get("/employees")
+        assert [e["id"] for e in response.json()] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_conditional_requests():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/employees/1")
+        etag = response.headers["ETag"]
+        last_modified = response.headers["Last-Modified"]
+
+        response = await ac.get("/employees/1", headers={"If-None-Match": etag})
+        assert response.status_code == 304, response.text
+        assert response.headers["ETag"] == etag
+        response = await ac.get(
+            "/employees/1", headers={"If-Modified-Since": last_modified}
+        )
+        assert response.status_code == 304, response.text
+
+        response = await ac.get("/employees?role=1")
+        # the validators come from the page, not from a count over the table
+        assert 'desc="1 queries"' in response.headers["Server-Timing"]
+        collection_tag = response.headers["ETag"]
+        response = await ac.get("/employees?role=1&fields=name")
+        response = await ac.get(
+            "/employees?role=1&fields=name",
+            headers={"If-None-Match": response.headers["ETag"]},
+        )
+        assert response.status_code == 304, response.text
+        response = await ac.get(
+            "/employees?role=1", headers={"If-None-Match": collection_tag}
+        )
+        assert response.status_code == 304, response.text
+        response = await ac.get(
+            "/employees?role=2", headers={"If-None-Match": collection_tag}
+        )
+        assert response.status_code == 200, response.text
+
+        response = await ac.patch(
+            "/employees/1", json={"age": 37}, headers={"If-Match": etag}
+        )
+        assert response.status_code == 200, response.text
+        new_etag = response.headers["ETag"]
+        assert new_etag != etag
+
+        response = await ac.patch(
+            "/employees/1", json={"age": 38}, headers={"If-Match": etag}
+        )
+        assert response.status_code == 412, response.text
+        response = await ac.get("/employees/1", headers={"If-None-Match": etag})
+        assert response.status_code == 200, response.text
+        assert response.json()["age"] == 37
+        response = await ac.get(
+            "/employees?role=1", headers={"If-None-Match": collection_tag}
+        )
+        assert response.status_code == 200, response.text
+
+        response = await ac.put(
+            "/employees/1",
+            json={
+                "name": "Alexey",
+                "age": 36,
+                "role": 1,
+                "salary": 350000,
+                "phone_number": "+9999999999",
+            },
+            headers={"If-Match": new_etag},
+        )
+        assert response.status_code == 200, response.text
+        response = await ac.patch(
+            "/employees/999", json={"age": 38}, headers={"If-Match": etag}
+        )
+        assert response.status_code == 412, response.text
+
+
+@pytest.fixture
+def no_change_lag():
+    lag, changes.CHANGES_SAFETY_LAG = changes.CHANGES_SAFETY_LAG, 0
+    yield
+    changes.CHANGES_SAFETY_LAG = lag
+
+
+@pytest.mark.asyncio
+async def test_employee_changes(no_change_lag):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/employees/changes")
+        assert response.status_code == 200, response.text
+        token = response.json()["next_token"]
+        response = await ac.get("/employees/changes", params={"since": token})
+        assert response.json()["changes"] == []
+
+        response = await ac.post(
+            "/employees",
+            json={
+                "name": "Feed",
+                "age": 30,
+                "role": 3,
+                "salary": 90000,
+                "phone_number": "+75550000001",
+            },
+        )
+        employee_id = response.json()["id"]
+        response = await ac.get("/employees/changes", params={"since": token})
+        feed = response.json()
+        assert [(c["type"], c["id"]) for c in feed["changes"]] == [
+            ("created", employee_id)
+        ]
+        assert feed["changes"][0]["employee"]["name"] == "Feed"
+        token = feed["next_token"]
+
+        await ac.patch(f"/employees/{employee_id}", json={"salary": 95000})
+        response = await ac.get("/employees/changes", params={"since": token})
+        feed = response.json()
+        assert [(c["type"], c["id"]) for c in feed["changes"]] == [
+            ("updated", employee_id)
+        ]
+        assert feed["changes"][0]["employee"]["salary"] == 95000
+        token = feed["next_token"]
+
+        await ac.delete(f"/employees/{employee_id}")
+        response = await ac.get(
+            "/employees/changes",
+            params={"stream": True, "wait": 1},
+            headers={"Last-Event-ID": token},
+        )
+        assert response.headers["content-type"].startswith("text/event-stream")
+        event = response.text.split("\n\n")[1]
+        assert event.startswith("id: ")
+        data = json.loads(event.split("data: ", 1)[1])
+        assert [(c["type"], c["id"]) for c in data["changes"]] == [
+            ("deleted", employee_id)
+        ]
+
+        response = await ac.get("/employees/changes", params={"since": "bogus"})
+        assert response.status_code == 400, response.text
+
+
+@pytest.mark.asyncio
+async def test_employee_changes_ordering(no_change_lag):
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/employees/changes")
+        token = response.json()["next_token"]
+
+        # too recent to be safe: an older timestamp may still be committing
+        changes.CHANGES_SAFETY_LAG = 60
+        await ac.patch("/employees/1", json={"age": 37})
+        response = await ac.get("/employees/changes", params={"since": token})
+        assert response.json()["changes"] == []
+        changes.CHANGES_SAFETY_LAG = 0
+        response = await ac.get("/employees/changes", params={"since": token})
+        assert [c["id"] for c in response.json()["changes"]] == [1]
+
+        # every chunk of a bulk write gets its own timestamp
+        async with TestSessionLocal() as db:
+            selection = EmployeeBulkUpdate(ids=[2, 1], changes={"age": 38})
+            await bulk_patch_employees(db=db, selection=selection, chunk_size=1)
+        first = (await ac.get("/employees/1")).json()
+        second = (await ac.get("/employees/2")).json()
+        assert first["updated_at"] < second["updated_at"]
+        await ac.patch("/employees/1", json={"age": 36})
+        await ac.patch("/employees/2", json={"age": 29})
+
+
+@pytest.mark.asyncio
+async def test_single_flight_reads():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        await cache.delete(employee_cache_key(1))
+        executed, shared = employee_flight.executed, employee_flight.shared
+        responses = await asyncio.gather(*(ac.get("/employees/1") for _ in range(20)))
+        assert {response.json()["name"] for response in responses} == {"Alexey"}
+        assert employee_flight.executed == executed + 1
+        assert employee_flight.shared > shared
+
+        shared = page_flight.shared
+        responses = await asyncio.gather(
+            *(ac.get("/employees?limit=1") for _ in range(10))
+        )
+        assert {response.json()[0]["id"] for response in responses} == {1}
+        assert page_flight.shared > shared
+        assert page_flight.calls == {}
+
+        # the shared load has its own session: the leader's may close first
+        await cache.delete(employee_cache_key(2))
+        async with TestSessionLocal() as db:
+            leader = asyncio.ensure_future(get_cached_employee(db=db, employee_id=2))
+            await asyncio.sleep(0)
+        leader.cancel()
+        async with TestSessionLocal() as db:
+            employee = await get_cached_employee(db=db, employee_id=2)
+        assert employee.name == "Mihail"
+
+        # a write makes later readers start a fresh load
+        employee_flight.calls[1] = asyncio.get_running_loop().create_future()
+        await ac.patch("/employees/1", json={"age": 36})
+        assert 1 not in employee_flight.calls
+
+
+@pytest.mark.asyncio
+async def test_read_db_dependency():
+    # the production read session, routed to the test database
+    override = app.dependency_overrides.pop(get_read_db)
+    read_engines = db_config.read_engines
+    db_config.read_engines = [read_engine(test_engine)]
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get("/employees")
+            assert response.status_code == 200, response.text
+            assert [e["id"] for e in response.json()] == [1, 2]
+
+            await cache.delete(employee_cache_key(1))
+            response = await ac.get("/employees/1")
+            assert response.status_code == 200, response.text
+            assert response.json()["name"] == "Alexey"
+            response = await ac.get("/employees/999")
+            assert response.status_code == 404, response.text
+    finally:
+        db_config.read_engines = read_engines
+        app.dependency_overrides[get_read_db] = override
+
+
+@pytest.mark.asyncio
+async def test_replica_reads_skip_cache():
+    db_config.replicas_lag = True
+    try:
+        await cache.delete(employee_cache_key(2))
+        async with TestSessionLocal() as db:
+            db.sync_session.info["replica"] = read_engine(test_engine)
+            employee = await get_cached_employee(db=db, employee_id=2)
+            batch = EmployeeBatchGet(ids=[2])
+            assert (await batch_get_employees(db=db, batch=batch))["missing"] == []
+        assert employee.name == "Mihail"
+        assert await cache.get(employee_cache_key(2)) is None
+    finally:
+        db_config.replicas_lag = False
+
+
+@pytest.mark.asyncio
+async def test_session_dependencies():
+    sessions = get_read_db()
+    db = await sessions.__anext__()
+    options = db.sync_session.get_bind().get_execution_options()
+    assert options["isolation_level"] == "AUTOCOMMIT"
+    assert pool_stats(engine).get("checkedout", 0) == 0
+    with pytest.raises(StopAsyncIteration):
+        await sessions.__anext__()
+
+    async with SessionLocal() as db:
+        db.sync_session.info["replica"] = read_engine(test_engine)
+        count = await db.scalar(select(func.count(Employee.id)))
+        assert count == 2
+
+    commits = []
+
+    def record_commit(conn):
+        commits.append(conn)
+
+    event.listen(test_engine.sync_engine, "commit", record_commit)
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.get("/employees/2")
+            assert response.status_code == 200, response.text
+            response = await ac.post("/employees", json={"name": "Invalid"})
+            assert response.status_code == 422, response.text
+            assert commits == []
+            response = await ac.patch("/employees/2", json={"age": 29})
+            assert response.status_code == 200, response.text
+            assert len(commits) == 1
+    finally:
+        event.remove(test_engine.sync_engine, "commit", record_commit)
+
+
+def test_redundant_indexes():
+    assert redundant_indexes(Employee.__table__) == []
+    table = Employee.__table__.to_metadata(MetaData())
+    Index("ix_employees_id", table.c.id)
+    Index("ix_employees_name_age", table.c.name, table.c.age)
+    assert sorted(redundant_indexes(table)) == [
+        ("ix_employees_id", "covered by the primary key"),
+        ("ix_employees_name", "prefix of ix_employees_name_age"),
+    ]
+
+
+async def wait_for_job(ac, location):
+    for _ in range(200):
+        job = (await ac.get(location)).json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"{location} did not finish")
+
+
+@pytest.mark.asyncio
+async def test_background_jobs():
+    job_runner.session_factory = TestSessionLocal
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post(
+                "/jobs/salary-adjustments", json={"role": 2, "percent": 10}
+            )
+            assert response.status_code == 202, response.text
+            location = response.headers["Location"]
+            job = await wait_for_job(ac, location)
+            assert job["status"] == "succeeded", job
+            assert job["processed"] == job["total"] == 1
+            response = await ac.get(f"{location}/result")
+            assert response.json()["result"] == {"affected": 1}
+            response = await ac.get("/employees/2")
+            assert response.json()["salary"] == 165000
+            await ac.patch("/employees/2", json={"salary": 150000})
+
+            employees = [
+                {
+                    "name": f"Job {i}",
+                    "age": 30,
+                    "role": 1,
+                    "salary": 100000,
+                    "phone_number": f"+7666000000{i}",
+                }
+                for i in range(3)
+            ]
+            employees[1]["phone_number"] = "7666"
+            response = await ac.post("/jobs/employees/bulk", json=employees)
+            job = await wait_for_job(ac, response.headers["Location"])
+            response = await ac.get(f"/jobs/{job['id']}/result")
+            result = response.json()["result"]
+            assert result["counts"] == {"created": 2, "error": 1}
+            assert result["errors"][0]["index"] == 1
+
+            response = await ac.get("/employees?name_prefix=Job")
+            ids = [employee["id"] for employee in response.json()]
+            response = await ac.post("/jobs/employees/bulk-delete", json={"ids": ids})
+            job = await wait_for_job(ac, response.headers["Location"])
+            assert (job["status"], job["processed"]) == ("succeeded", 2)
+
+            response = await ac.post(
+                "/jobs/employees/bulk-patch",
+                json={"filter": {"role": 2}, "changes": {"role": 9}},
+            )
+            job = await wait_for_job(ac, response.headers["Location"])
+            assert job["status"] == "failed"
+            assert job["error"].startswith("Invalid role!")
+
+            response = await ac.get("/jobs/999")
+            assert response.status_code == 404, response.text
+    finally:
+        await job_runner.stop()
+        job_runner.session_factory = SessionLocal
+
+
+@pytest.mark.asyncio
+async def test_job_resume():
+    job_runner.session_factory = TestSessionLocal
+    stale = datetime.utcnow() - timedelta(hours=1)
+    params = {"role": 1, "percent": 10}
+    try:
+        # a worker died after committing the only chunk: resuming must not
+        # raise the salary again
+        async with TestSessionLocal() as db:
+            job = Job(
+                kind="salary_adjustment",
+                params=params,
+                status="running",
+                processed=1,
+                total=1,
+                checkpoint=1,
+                heartbeat_at=stale,
+            )
+            db.add(job)
+            await db.commit()
+        job_runner.enqueue(job.id)
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            result = await wait_for_job(ac, f"/jobs/{job.id}")
+            assert (result["status"], result["processed"]) == ("succeeded", 1)
+            response = await ac.get("/employees/1")
+            assert response.json()["salary"] == 350000
+
+        # a running job with a fresh heartbeat stays with its worker
+        async with TestSessionLocal() as db:
+            busy = Job(
+                kind="salary_adjustment",
+                params=params,
+                status="running",
+                heartbeat_at=datetime.utcnow(),
+            )
+            db.add(busy)
+            await db.commit()
+            assert not await claim_job(db, busy.id)
+        job_runner.current.add(busy.id)
+    finally:
+        await job_runner.stop()
+        job_runner.session_factory = SessionLocal
+    job_runner.current.clear()
+    async with TestSessionLocal() as db:
+        busy = await db.get(Job, busy.id)
+        assert busy.status == "queued"
+        await db.delete(busy)
+        await db.commit()
+
+
+class FakeRedisScripts:
+    def __init__(self, reply):
+        self.reply = reply
+
+    async def eval(self, script, numkeys, *args):
+        if isinstance(self.reply, Exception):
+            raise self.reply
+        return self.reply
+
+
+@pytest.mark.asyncio
+async def test_admission_control():
+    limiter, limits = admission_control.rate_limiter, admission_control.route_limits
+    concurrency = admission_control.concurrency
+    admission_control.rate_limiter = MemoryRateLimiter()
+    admission_control.route_limits = {
+        ("GET", "/employees/{employee_id}"): RateLimit(rate=1, burst=2)
+    }
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            statuses = [(await ac.get("/employees/1")).status_code for _ in range(3)]
+            assert statuses == [200, 200, 429]
+            response = await ac.get("/employees/1")
+            assert response.headers["Retry-After"] == "1"
+            response = await ac.get("/employees")
+            assert response.status_code == 200, response.text
+
+            admission_control.concurrency = ConcurrencyLimiter(limit=1, max_wait=0)
+            assert await admission_control.concurrency.acquire()
+            response = await ac.get("/employees")
+            assert response.status_code == 503, response.text
+            assert response.headers["Retry-After"] == "1"
+            admission_control.concurrency.release()
+            response = await ac.get("/employees")
+            assert response.status_code == 200, response.text
+
+            response = await ac.get("/metrics")
+            assert (
+                'admission_rejections_total{reason="rate_limit",method="GET",'
+                'route="/employees/{employee_id}"} 2'
+            ) in response.text
+    finally:
+        admission_control.rate_limiter = limiter
+        admission_control.route_limits = limits
+        admission_control.concurrency = concurrency
+
+    queue = ConcurrencyLimiter(limit=1, max_wait=1)
+    assert await queue.acquire()
+    waiting = asyncio.ensure_future(queue.acquire())
+    await asyncio.sleep(0)
+    queue.release()
+    assert await waiting and queue.in_flight == 1
+
+    assert (
+        await RedisRateLimiter(FakeRedisScripts(b"0.5")).acquire(
+            "client", RateLimit(1, 1)
+        )
+        == 0.5
+    )
+    broken = RedisRateLimiter(FakeRedisScripts(ConnectionError()))
+    assert await broken.acquire("client", RateLimit(1, 1)) == 0
+    assert broken.errors == 1
+
+
+@pytest.mark.asyncio
+async def test_field_projection_and_compression():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/employees?fields=id,name")
+        assert response.json() == [
+            {"id": 1, "name": "Alexey"},
+            {"id": 2, "name": "Mihail"},
+        ]
+        response = await ac.get("/employees?fields=name&sort=-salary&limit=1")
+        assert response.json() == [{"name": "Alexey"}]
+        cursor = response.headers["X-Next-Cursor"]
+        response = await ac.get(
+            "/employees",
+            params={"fields": "name", "sort": "-salary", "limit": 1, "cursor": cursor},
+        )
+        assert response.json() == [{"name": "Mihail"}]
+        response = await ac.get("/employees?fields=id,password")
+        assert response.status_code == 400, response.text
+
+        # the documented item shape allows any subset of the columns
+        schema = (await ac.get("/openapi.json")).json()
+        projection = schema["components"]["schemas"]["EmployeeProjection"]
+        assert "required" not in projection
+        assert set(projection["properties"]) == set(Employee.__table__.c.keys())
+
+        response = await ac.get("/employees", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+        response = await ac.get(
+            "/employees/export", headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert len(response.text.splitlines()) == 2
+
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0.5, br;q=0.8") == "br"
+    assert negotiate_encoding("*") == "zstd"
+    assert negotiate_encoding("gzip;q=0, identity") is None
+
+
+@pytest.mark.asyncio
+async def test_batch_get_employees():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/employees/batch-get", json={"ids": [2, 999, 1, 2]})
+        assert response.status_code == 200, response.text
+        result = response.json()
+        assert [employee["id"] for employee in result["employees"]] == [2, 1, 2]
+        assert result["missing"] == [999]
+
+        hits = cache.hits
+        response = await ac.post("/employees/batch-get", json={"ids": [1, 2]})
+        assert response.status_code == 200, response.text
+        assert cache.hits == hits + 2
+
+        response = await ac.post(
+            "/employees/batch-get",
+            json={"phone_numbers": ["+79515555555", "+70000000000", "+9999999999"]},
+        )
+        assert response.status_code == 200, response.text
+        result = response.json()
+        assert [employee["id"] for employee in result["employees"]] == [2, 1]
+        assert result["missing"] == ["+70000000000"]
+
+        response = await ac.post(
+            "/employees/batch-get", json={"ids": [1], "phone_numbers": ["+1"]}
+        )
+        assert response.status_code == 422, response.text
+        response = await ac.post("/employees/batch-get", json={"ids": []})
+        assert response.status_code == 422, response.text
+
+
+@pytest.mark.asyncio
+async def test_employee_validation():
+    rows = [
+        {"role": 1, "phone_number": "+7900"},
+        {"role": 9, "phone_number": "+7900"},
+        {"role": 2, "phone_number": "7900"},
+        {"age": 30},
+    ]
+    assert employee_errors(rows) == [
+        None,
+        "Invalid role! Available roles: [1, 2, 3, 4]",
+        "Phone number must contain '+' ",
+        None,
+    ]
+    with pytest.raises(EmployeeValidationError) as error:
+        Employee(name="Bad", role=9)
+    assert error.value.detail == "Invalid role! Available roles: [1, 2, 3, 4]"
+    with pytest.raises(EmployeeValidationError):
+        Employee(name="Bad", phone_number="7900")
+
+
+@pytest.mark.asyncio
+async def test_import_employees():
+    lines = [
+        '{"name": "Olga", "age": 31, "role": 3, "salary": 120000, '
+        '"phone_number": "+70000000101"}',
+        '{"name": "Bad", "age": 31, "role": 9, "salary": 1, "phone_number": "+1"}',
+        "not json",
+    ]
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/employees/import", content="\n".join(lines))
+        assert response.status_code == 200, response.text
+        result = response.json()
+        assert (result["processed"], result["imported"], result["failed"]) == (3, 1, 2)
+        assert result["errors"] == [
+            {"line": 2, "detail": "Invalid role! Available roles: [1, 2, 3, 4]"},
+            {"line": 3, "detail": "Invalid record"},
+        ]
+
+        content = (
+            "id,name,age,role,salary,phone_number\r\n"
+            "7,Olga,32,3,130000,+70000000101\r\n"
+            "8,Ivan,40,abc,1,+70000000102\r\n"
+            "9,Ivan,40,4,200000,+70000000102\r\n"
+            '10,"Anna\r\nMaria",27,3,90000,+70000000103\r\n'
+            "11,Petr,33,3,1,+70000000104\r\n"
+        )
+        response = await ac.post("/employees/import?format=csv", content=content)
+        assert response.status_code == 200, response.text
+        result = response.json()
+        assert (result["imported"], result["failed"]) == (4, 1)
+        assert result["errors"][0]["line"] == 3
+
+        response = await ac.post(
+            "/employees/batch-get",
+            json={"phone_numbers": ["+70000000101", "+70000000102", "+70000000103"]},
+        )
+        employees = response.json()["employees"]
+        assert [(e["name"], e["age"], e["role"]) for e in employees] == [
+            ("Olga", 32, 3),
+            ("Ivan", 40, 4),
+            ("Anna\nMaria", 27, 3),
+        ]
+
+        response = await ac.post("/employees/import?format=csv", content="name\n")
+        assert response.status_code == 400, response.text
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(
+    not os.getenv("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL is not set"
+)
+async def test_import_employees_copy():
+    engine = create_async_engine(os.getenv("TEST_POSTGRES_URL"))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    async def lines():
+        yield "name,age,role,salary,phone_number"
+        yield "Olga,31,3,120000,+70000000101"
+        yield '"Anna'
+        yield 'Maria",27,3,90000,+70000000103'
+        yield "Olga,32,3,130000,+70000000101"
+        yield "Bad,40,9,1,+70000000102"
+
+    try:
+        async with AsyncSession(engine) as db:
+            result = await import_employees(db, lines(), ExportFormat.csv)
+            assert (result.imported, result.failed) == (3, 1)
+            assert result.errors[0].line == 6
+            rows = await db.execute(
+                select(Employee.name, Employee.age).order_by(Employee.phone_number)
+            )
+            assert rows.all() == [("Olga", 32), ("Anna\nMaria", 27)]
+
+            # a second run updates the existing rows through the staging table
+            result = await import_employees(db, lines(), ExportFormat.csv)
+            assert result.imported == 3
+            count = await db.execute(select(func.count(Employee.id)))
+            assert count.scalar() == 2
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_tuned_engines():
+    path = "/tmp/tuned.db"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.environ["DB_SQLITE_TUNED"] = "1"
+    try:
+        writer = create_engine_from_env(f"sqlite+aiosqlite:///{path}")
+        reader = create_engine_from_env(f"sqlite+aiosqlite:///{path}", readonly=True)
+    finally:
+        del os.environ["DB_SQLITE_TUNED"]
+    async with writer.begin() as conn:
+        await conn.exec_driver_sql("CREATE TABLE t (x integer)")
+        await conn.exec_driver_sql("INSERT INTO t VALUES (1)")
+        result = await conn.exec_driver_sql("PRAGMA journal_mode")
+        assert result.scalar() == "wal"
+        result = await conn.exec_driver_sql("PRAGMA busy_timeout")
+        assert result.scalar() == 5000
+    async with reader.connect() as conn:
+        result = await conn.exec_driver_sql("SELECT count(*) FROM t")
+        assert result.scalar() == 1
+        with pytest.raises(Exception, match="readonly"):
+            await conn.exec_driver_sql("INSERT INTO t VALUES (2)")
+    assert pool_stats(writer)["size"] == 1
+    assert pool_stats(reader)["size"] == 4
+    await writer.dispose()
+    await reader.dispose()
+
+
 @pytest.mark.asyncio
 async def test_drop_tables():
     async with AsyncClient(app=app, base_url="http://test") as ac:
@@ -287,3 +1571,5 @@ async def test_drop_tables():
         await conn.run_sync(Base.metadata.drop_all)
 
     app.dependency_overrides[get_db] = get_db  # setting back main database
+    app.dependency_overrides[get_read_db] = get_read_db
+    app.dependency_overrides[get_snapshot_db] = get_snapshot_db